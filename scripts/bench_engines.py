@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+""" Benchmarks the filter's engines side by side, without ROS.
+
+	Every combination of the engines given on the command line (see engines) localizes the same simulated drives
+	(see synthetic) on the same map, from the same random seeds, so that the only thing that differs between the
+	rows of the report is the engines.  For each combination the benchmark records
+		update: mean and 95th percentile milliseconds per scan, leaving out the first one (global initialization)
+		convergence: scans until the estimate stays within 0.3 m of the truth (averaged over the drives that converge)
+		converged: how many of the drives converged
+		error: mean position error over the second half of every drive, and at the end of them
+	Engines that aren't given keep the filter's defaults.  The simulated odometry has 3% noise unless --odom-noise
+	says otherwise, perfect odometry hides a filter that can't correct drift.
+
+	usage: bench_engines.py [--map maps/CCroom.yaml | --size 512 --density 0.01] [--drives 3] [--scans 200] [--odom-noise 0.03]
+							[--motion-model odometry sample_odometry] [--resampler multinomial systematic] ...
+"""
+
+import argparse
+import csv
+import itertools
+import math
+import time
+
+import numpy as np
+
+from comp_robo_project2.core import ParticleFilterCore, DEFAULT_ENGINES
+from comp_robo_project2.engines import ENGINE_KINDS, available
+from comp_robo_project2.map_loader import load_map
+from comp_robo_project2.occupancy_field import OccupancyField
+from comp_robo_project2.pf_kernels import get_backend
+from comp_robo_project2.synthetic import synthetic_map, drive, convergence_scans, format_value
+
+FIELDS = list(ENGINE_KINDS) + ['drives', 'converged', 'convergence_scans', 'mean_update_ms', 'p95_update_ms',
+							   'mean_error', 'final_error']
+
+def run_drive(field, engines, drive_arrays, seed, n_particles=None, kernel_backend='auto'):
+	""" Localize one drive (scans, odometry, truth) with engines.  Returns the latency and position error of every
+		scan as two arrays """
+	scans, odoms, truths = drive_arrays
+	np.random.seed(seed)
+	pf = ParticleFilterCore(field, kernel_backend=kernel_backend, engines=engines)
+	if n_particles != None:
+		pf.n_particles = n_particles
+	latencies = np.empty(len(scans))
+	errors = np.empty(len(scans))
+	for i in range(len(scans)):
+		scan_start = time.time()
+		pf.process_scan(scans[i], tuple(odoms[i]))
+		latencies[i] = time.time() - scan_start
+		errors[i] = math.hypot(pf.robot_xy_theta[0] - truths[i][0], pf.robot_xy_theta[1] - truths[i][1])
+	return latencies, errors
+
+def summarize(engines, results):
+	""" The report row of one engine combination from the (latencies, errors) of each of its drives """
+	row = dict(engines)
+	row['drives'] = len(results)
+	update_latencies = np.concatenate([latencies[1:] for latencies, errors in results])
+	if len(update_latencies):
+		row['mean_update_ms'] = 1000*np.mean(update_latencies)
+		row['p95_update_ms'] = 1000*np.percentile(update_latencies, 95)
+	convergence = [convergence_scans(errors) for latencies, errors in results]
+	convergence = [scans for scans in convergence if scans != None]
+	row['converged'] = len(convergence)
+	if convergence:
+		row['convergence_scans'] = np.mean(convergence)
+	row['mean_error'] = np.mean(np.concatenate([errors[len(errors)//2:] for latencies, errors in results]))
+	row['final_error'] = np.mean([errors[-1] for latencies, errors in results])
+	return row
+
+def report(rows):
+	""" The benchmark results as a table, one row per engine combination """
+	columns = [(kind, '%s') for kind in ENGINE_KINDS] + [('converged', '%d'), ('convergence_scans', '%.1f'),
+		('mean_update_ms', '%.1f'), ('p95_update_ms', '%.1f'), ('mean_error', '%.2f'), ('final_error', '%.2f')]
+	widths = [max([len(name)] + [len(format_value(row.get(name), fmt)) for row in rows]) for name, fmt in columns]
+	lines = ['  '.join(name.rjust(width) for (name, fmt), width in zip(columns, widths))]
+	for row in rows:
+		lines.append('  '.join(format_value(row.get(name), fmt).rjust(width) for (name, fmt), width in zip(columns, widths)))
+	return '\n'.join(lines)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the filter engines side by side')
+	parser.add_argument('--map', default=None, help='map YAML file to drive in (a synthetic floor when omitted)')
+	parser.add_argument('--size', type=int, default=512, help='synthetic map size in cells')
+	parser.add_argument('--density', type=float, default=0.01, help='fraction of the synthetic floor covered by boxes')
+	parser.add_argument('--drives', type=int, default=3, help='simulated drives per engine combination')
+	parser.add_argument('--scans', type=int, default=200, help='scans per drive')
+	parser.add_argument('--odom-noise', type=float, default=0.03, help='odometry error as a fraction of each step')
+	parser.add_argument('--particles', type=int, default=None, help='particles per filter')
+	parser.add_argument('--kernels', default='auto', choices=['auto', 'numpy', 'numba'], help='kernel backend')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--out', default=None, help='csv file to write the results to')
+	for kind in ENGINE_KINDS:
+		parser.add_argument('--' + kind.replace('_', '-'), nargs='+', choices=available(kind), default=[DEFAULT_ENGINES[kind]],
+							help='%s engines to compare (default: %s)' % (kind.replace('_', ' '), DEFAULT_ENGINES[kind]))
+	args = parser.parse_args()
+
+	worldMap = load_map(args.map) if args.map else synthetic_map(args.size, args.density, args.seed)
+	field = OccupancyField(worldMap)
+	drives = [drive(field, get_backend(args.kernels), args.scans, args.seed + i, args.odom_noise)
+			  for i in range(args.drives)]
+
+	rows = []
+	for names in itertools.product(*[getattr(args, kind) for kind in ENGINE_KINDS]):
+		engines = dict(zip(ENGINE_KINDS, names))
+		print ' '.join(engines[kind] for kind in ENGINE_KINDS)
+		results = [run_drive(field, engines, drive_arrays, args.seed + i, args.particles, args.kernels)
+				   for i, drive_arrays in enumerate(drives)]
+		rows.append(summarize(engines, results))
+	if args.out:
+		with open(args.out, 'w') as f:
+			writer = csv.DictWriter(f, FIELDS)
+			writer.writeheader()
+			writer.writerows(rows)
+	print
+	print report(rows)
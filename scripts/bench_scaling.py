@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+""" Benchmarks how the particle filter scales with the size of the map.
+
+	Synthetic floors (rooms separated by walls with doorways, plus a given fraction of the floor covered by random
+	boxes) are generated at increasing sizes.  Every (size, density) case runs in a fresh process so that its peak
+	memory can be measured on its own, and for each case the benchmark records
+		build: seconds to build the OccupancyField (distance transform) and the scan matcher
+		rss: peak resident memory after loading the map, building the field and building the scan matcher
+		global init: seconds for the first update, which seeds the cloud from the scan matcher over the whole map
+		update: mean and 95th percentile seconds per update after that
+		convergence: scans (and seconds) until the estimate stays within 0.3 m of the truth, with the simulated
+					 odometry off by --odom-noise (3% by default) of every step
+	The report ends with the slope of each stage on a log-log plot against the number of cells (1 = linear in the
+	area of the map), which is what tells us which stage breaks first on big floors.
+
+	usage: bench_scaling.py [--sizes 512 1024 2048 4096] [--densities 0.01 0.05] [--scans 60] [--odom-noise 0.03]
+						[--out results.csv]
+"""
+
+import argparse
+import csv
+import math
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+from comp_robo_project2.synthetic import synthetic_map, drive, convergence_scans, format_value
+
+FIELDS = ['size', 'density', 'cells', 'field_seconds', 'matcher_seconds', 'global_init_seconds', 'mean_update_ms',
+		  'p95_update_ms', 'convergence_scans', 'convergence_seconds', 'final_error', 'map_rss_mb', 'field_rss_mb',
+		  'matcher_rss_mb', 'peak_rss_mb', 'error']
+
+def peak_rss_mb():
+	""" Peak resident memory of this process so far (ru_maxrss is in kilobytes on Linux, bytes on OS X) """
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss/(1024.0*1024.0) if sys.platform == 'darwin' else rss/1024.0
+
+def run_case(size, density, n_scans, seed, odom_noise=0.03):
+	""" Benchmark one map and return its row of the report (as a dictionary) """
+	from comp_robo_project2.occupancy_field import OccupancyField
+	from comp_robo_project2.core import ParticleFilterCore
+	from comp_robo_project2.scan_matcher import CorrelativeScanMatcher
+	row = dict(size=size, density=density, cells=size*size)
+	try:
+		worldMap = synthetic_map(size, density, seed)
+		row['map_rss_mb'] = peak_rss_mb()
+
+		start = time.time()
+		field = OccupancyField(worldMap)
+		row['field_seconds'] = time.time() - start
+		row['field_rss_mb'] = peak_rss_mb()
+
+		start = time.time()
+		CorrelativeScanMatcher(field)
+		row['matcher_seconds'] = time.time() - start
+		row['matcher_rss_mb'] = peak_rss_mb()
+
+		np.random.seed(seed)
+		pf = ParticleFilterCore(field)
+		scans, odoms, truths = drive(field, pf.kernels, n_scans, seed, odom_noise)
+		latencies = np.empty(n_scans)
+		errors = np.empty(n_scans)
+		for i in range(n_scans):
+			scan_start = time.time()
+			pf.process_scan(scans[i], tuple(odoms[i]))
+			latencies[i] = time.time() - scan_start
+			pose = pf.robot_xy_theta
+			errors[i] = math.hypot(pose[0] - truths[i][0], pose[1] - truths[i][1])
+		row['global_init_seconds'] = latencies[0]
+		if n_scans > 1:
+			row['mean_update_ms'] = 1000*np.mean(latencies[1:])
+			row['p95_update_ms'] = 1000*np.percentile(latencies[1:], 95)
+		converged = convergence_scans(errors)
+		if converged != None:
+			row['convergence_scans'] = converged
+			row['convergence_seconds'] = np.sum(latencies[:converged])
+		row['final_error'] = errors[-1]
+	except MemoryError:
+		row['error'] = 'out of memory'
+	row['peak_rss_mb'] = peak_rss_mb()
+	return row
+
+def run_case_in_process(size, density, n_scans, seed, timeout, odom_noise=0.03):
+	""" run_case in a fresh process so that its memory use isn't mixed up with the cases before it """
+	results = multiprocessing.Queue()
+	def target():
+		results.put(run_case(size, density, n_scans, seed, odom_noise))
+	process = multiprocessing.Process(target=target)
+	process.start()
+	process.join(timeout)
+	if process.is_alive():
+		process.terminate()
+		process.join()
+		return dict(size=size, density=density, cells=size*size, error='timed out after %d s' % timeout)
+	if results.empty():
+		# killed, most likely by the kernel running out of memory
+		return dict(size=size, density=density, cells=size*size, error='exited with code %s' % process.exitcode)
+	return results.get()
+
+def scaling_slopes(rows, column):
+	""" The slope of log(column) against log(cells) for each density, None where there are fewer than two points """
+	slopes = {}
+	for density in sorted(set(row['density'] for row in rows)):
+		points = [(row['cells'], row.get(column)) for row in rows if row['density'] == density]
+		points = [(cells, value) for cells, value in points if value not in (None, '') and value > 0]
+		if len(points) < 2:
+			slopes[density] = None
+		else:
+			slopes[density] = np.polyfit(np.log([p[0] for p in points]), np.log([p[1] for p in points]), 1)[0]
+	return slopes
+
+def report(rows):
+	""" The benchmark results as a table followed by the scaling slope of each stage """
+	columns = [('size', '%d'), ('density', '%.3f'), ('field_seconds', '%.2f'), ('matcher_seconds', '%.2f'),
+			   ('global_init_seconds', '%.2f'), ('mean_update_ms', '%.1f'), ('p95_update_ms', '%.1f'),
+			   ('convergence_scans', '%d'), ('final_error', '%.2f'), ('field_rss_mb', '%.0f'), ('peak_rss_mb', '%.0f')]
+	lines = ['  '.join(name for name, fmt in columns)]
+	for row in rows:
+		line = '  '.join(format_value(row.get(name), fmt).rjust(len(name)) for name, fmt in columns)
+		if row.get('error'):
+			line += '  ' + row['error']
+		lines.append(line)
+	lines.append('')
+	lines.append('log-log slope against the number of cells (1 = linear in map area)')
+	for name in ['field_seconds', 'matcher_seconds', 'global_init_seconds', 'mean_update_ms', 'peak_rss_mb']:
+		slopes = scaling_slopes(rows, name)
+		lines.append('  %-20s ' % name + '  '.join('density %.3f: %s' % (density, format_value(slope, '%.2f'))
+														  for density, slope in sorted(slopes.items())))
+	return '\n'.join(lines)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark how the filter scales with map size')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048, 4096], help='map sizes in cells')
+	parser.add_argument('--densities', type=float, nargs='+', default=[0.01, 0.05], help='fraction of the floor covered by boxes')
+	parser.add_argument('--scans', type=int, default=60, help='scans to run the filter for on each map')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--odom-noise', type=float, default=0.03, help='odometry error as a fraction of each step')
+	parser.add_argument('--timeout', type=int, default=1800, help='seconds before a case is given up on')
+	parser.add_argument('--out', default=None, help='csv file to write the results to')
+	args = parser.parse_args()
+
+	rows = []
+	for density in args.densities:
+		for size in args.sizes:
+			print "size %d density %.3f" % (size, density)
+			rows.append(run_case_in_process(size, density, args.scans, args.seed, args.timeout, args.odom_noise))
+	if args.out:
+		with open(args.out, 'w') as f:
+			writer = csv.DictWriter(f, FIELDS)
+			writer.writeheader()
+			writer.writerows(rows)
+	print
+	print report(rows)
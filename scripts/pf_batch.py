@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+""" Offline batch localization: runs the particle filter over recorded runs as fast as the CPU allows instead
+	of replaying them through the live node in real time.
+
+	Runs are spread over a pool of worker processes.  Each map's occupancy field, scan matcher and beam gate are
+	built once by the parent before the workers are forked, so all the workers share one copy of them (copy on
+	write) and reuse them for every run on that map.  Where the workers can't inherit them (no fork) each worker
+	builds its own, memory mapping the occupancy field from the OccupancyFieldCache the parent filled.
+	For every run a trajectory (<run>_trajectory.csv) is written to the output directory, and summary.csv gets one
+	line of timing (and, when the run has ground truth, error) numbers per run.  With --telemetry every update of
+	every run is also recorded (see telemetry) to <run>.telemetry.  The filter is the ROS-free ParticleFilterCore, and
+	--motion-model, --sensor-model, --resampler and --pose-estimator swap its engines (see engines).
+
+	A run is an .npz file with the arrays
+		ranges: (n x 360) laser ranges, one row per scan (0 where there was no return)
+		odom: (n x 3) pose of the robot base in the odometry frame (x,y,theta) when each scan was taken
+		stamps: (n) scan times in seconds
+		truth (optional): (n x 3) ground truth pose of the robot in the map frame, used to report errors
+		map_file (optional): the map YAML file to localize in, instead of the one given with --map
+	Use the convert command to make one from a bag file.
+
+	usage: pf_batch.py run --map maps/CCroom.yaml --out results [--resampler systematic] runs/*.npz
+		   pf_batch.py convert recording.bag recording.npz
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from comp_robo_project2 import se2
+from comp_robo_project2.core import ParticleFilterCore
+from comp_robo_project2.engines import ENGINE_KINDS, available
+from comp_robo_project2.occupancy_field import OccupancyField
+from comp_robo_project2.map_loader import load_map
+from comp_robo_project2.startup import OccupancyFieldCache
+from comp_robo_project2.telemetry import TelemetryRecorder
+from comp_robo_project2.transform_cache import yaw_from_quaternion
+
+SUMMARY_FIELDS = ['run', 'map_file', 'scans', 'full_updates', 'weight_only_updates', 'resamples', 'setup_seconds',
+				  'seconds', 'mean_update_ms', 'p95_update_ms', 'max_update_ms', 'mean_error', 'final_error', 'error']
+
+# the maps' fields, scan matchers and beam gates, built by prepare_maps in the parent (and inherited by the
+# workers) or else by each worker the first time it needs them
+_field_cache = None
+_fields = {}
+_scan_matchers = {}
+_beam_gates = {}
+
+def init_worker(cache_directory):
+	""" Set up a worker process.  Fields it didn't inherit from the parent are loaded memory mapped from the cache """
+	global _field_cache
+	_field_cache = OccupancyFieldCache(cache_directory, mmap_mode='r')
+
+def field_for(map_file):
+	""" The occupancy field for map_file, built once per process """
+	if map_file not in _fields:
+		_fields[map_file] = OccupancyField(load_map(map_file), _field_cache)
+	return _fields[map_file]
+
+def filter_for(map_file, engines):
+	""" A ParticleFilterCore with engines that localizes in map_file.  The scan matcher and beam gate are only
+		built for the first run on each map in a process """
+	pf = ParticleFilterCore(engines=engines)
+	pf.set_map(field_for(map_file), _scan_matchers.get(map_file), _beam_gates.get(map_file))
+	_scan_matchers[map_file] = pf.scan_matcher
+	_beam_gates[map_file] = pf.beam_gate
+	return pf
+
+def prepare_maps(map_files, engines, cache_directory=None):
+	""" Build the occupancy field, scan matcher and beam gate of every map in map_files in this process, so that
+		worker processes forked afterwards share them instead of each building their own.  Returns the
+		OccupancyFieldCache the fields were stored in """
+	global _field_cache
+	_field_cache = OccupancyFieldCache(cache_directory)
+	for map_file in sorted(map_files):
+		filter_for(map_file, engines)
+	return _field_cache
+
+def run_name(run_path):
+	return os.path.splitext(os.path.basename(run_path))[0]
+
+def localize_run(job):
+	""" Run the filter over one recorded run and write its trajectory.  job is a tuple of
+		(run_path, map_file, out_directory, n_particles, seed, telemetry, engines).  Returns the run's summary as a
+		dictionary """
+	run_path, map_file, out_directory, n_particles, seed, telemetry, engines = job
+	summary = dict((field, '') for field in SUMMARY_FIELDS)
+	summary['run'] = run_path
+	start = time.time()
+	try:
+		run = np.load(run_path)
+		if 'map_file' in run.files:
+			map_file = str(run['map_file'])
+		summary['map_file'] = map_file
+		np.random.seed(seed)
+		pf = filter_for(map_file, engines)
+		if n_particles != None:
+			pf.n_particles = n_particles
+		if telemetry:
+			pf.telemetry = TelemetryRecorder(os.path.join(out_directory, run_name(run_path) + '.telemetry'))
+		ranges = run['ranges']
+		odom = run['odom']
+		stamps = run['stamps'] if 'stamps' in run.files else np.arange(len(ranges), dtype=np.float64)
+		truth = run['truth'] if 'truth' in run.files else None
+	except Exception as e:
+		summary['error'] = repr(e)
+		return summary
+	summary['setup_seconds'] = '%.3f' % (time.time() - start)
+
+	n = len(ranges)
+	trajectory = np.empty((n, 3))
+	latencies = np.empty(n)
+	for i in range(n):
+		scan_start = time.time()
+		pf.process_scan(ranges[i], tuple(odom[i]))
+		latencies[i] = time.time() - scan_start
+		trajectory[i] = pf.robot_xy_theta
+	if pf.telemetry != None:
+		pf.telemetry.close()
+
+	columns = [stamps, trajectory[:,0], trajectory[:,1], trajectory[:,2]]
+	header = ['stamp', 'x', 'y', 'theta']
+	if truth is not None:
+		position_error = np.hypot(trajectory[:,0] - truth[:,0], trajectory[:,1] - truth[:,1])
+		heading_error = np.abs(se2.diff(trajectory[:,2], truth[:,2]))
+		columns += [position_error, heading_error]
+		header += ['position_error', 'heading_error']
+		summary['mean_error'] = '%.4f' % np.mean(position_error)
+		summary['final_error'] = '%.4f' % position_error[-1]
+	np.savetxt(os.path.join(out_directory, run_name(run_path) + '_trajectory.csv'), np.column_stack(columns),
+			   fmt='%.6f', delimiter=',', header=','.join(header), comments='')
+
+	summary['scans'] = n
+	summary['full_updates'] = pf.scheduler.metrics['full']
+	summary['weight_only_updates'] = pf.scheduler.metrics['weight_only']
+	summary['resamples'] = pf.scheduler.metrics['resampled']
+	summary['seconds'] = '%.3f' % (time.time() - start)
+	if n:
+		summary['mean_update_ms'] = '%.3f' % (1000*np.mean(latencies))
+		summary['p95_update_ms'] = '%.3f' % (1000*np.percentile(latencies, 95))
+		summary['max_update_ms'] = '%.3f' % (1000*np.max(latencies))
+	return summary
+
+def run_batch(run_paths, map_file, out_directory, processes=None, n_particles=None, seed=0, cache_directory=None,
+			  telemetry=False, engines=None):
+	""" Localize every run in run_paths on a pool of processes (one per core by default) and write the trajectories
+		and summary.csv (and with telemetry set, a recording of every run) to out_directory.  engines picks the
+		filter's engines by kind (see ParticleFilterCore).  Returns the list of run summaries """
+	if not os.path.isdir(out_directory):
+		os.makedirs(out_directory)
+
+	jobs = []
+	map_files = set()
+	for i, run_path in enumerate(run_paths):
+		with np.load(run_path) as run:
+			run_map_file = str(run['map_file']) if 'map_file' in run.files else map_file
+		if not run_map_file:
+			raise ValueError('no map given for ' + run_path)
+		map_files.add(run_map_file)
+		jobs.append((run_path, run_map_file, out_directory, n_particles, seed + i, telemetry, engines))
+	# biggest runs first so that a long run doesn't start last
+	jobs.sort(key=lambda job: -os.path.getsize(job[0]))
+
+	cache = prepare_maps(map_files, engines, cache_directory)
+
+	start = time.time()
+	summaries = []
+	pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(cache.directory,))
+	try:
+		for summary in pool.imap_unordered(localize_run, jobs):
+			summaries.append(summary)
+			status = ('failed: ' + summary['error']) if summary['error'] else ('%s s' % summary['seconds'])
+			print "[%d/%d] %s %s" % (len(summaries), len(jobs), summary['run'], status)
+	finally:
+		pool.close()
+		pool.join()
+
+	summaries.sort(key=lambda summary: summary['run'])
+	with open(os.path.join(out_directory, 'summary.csv'), 'w') as f:
+		writer = csv.DictWriter(f, SUMMARY_FIELDS)
+		writer.writeheader()
+		writer.writerows(summaries)
+	print "localized %d runs in %.1f s" % (len(summaries), time.time() - start)
+	return summaries
+
+def convert_bag(bag_path, out_path, scan_topic='scan', odom_topic='odom', map_file=None):
+	""" Write the scans in a bag file, along with the odometry pose at each of them, as a run for run_batch """
+	import rosbag
+	ranges = []
+	odom = []
+	stamps = []
+	last_odom = None
+	bag = rosbag.Bag(bag_path)
+	try:
+		for topic, msg, t in bag.read_messages(topics=[scan_topic, odom_topic]):
+			if topic == odom_topic:
+				orientation = msg.pose.pose.orientation
+				last_odom = (msg.pose.pose.position.x, msg.pose.pose.position.y,
+							 yaw_from_quaternion((orientation.x, orientation.y, orientation.z, orientation.w)))
+			elif last_odom != None and len(msg.ranges) == 360:
+				ranges.append(msg.ranges)
+				odom.append(last_odom)
+				stamps.append(msg.header.stamp.to_sec())
+	finally:
+		bag.close()
+	arrays = dict(ranges=np.array(ranges, dtype=np.float32), odom=np.array(odom), stamps=np.array(stamps))
+	if map_file:
+		arrays['map_file'] = np.array(os.path.abspath(map_file))
+	np.savez_compressed(out_path, **arrays)
+	print "wrote %d scans to %s" % (len(ranges), out_path)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Localize recorded runs offline')
+	commands = parser.add_subparsers(dest='command')
+	run_parser = commands.add_parser('run', help='localize runs')
+	run_parser.add_argument('runs', nargs='+', help='.npz runs to localize')
+	run_parser.add_argument('--map', default='', help="map YAML file for runs that don't name their own")
+	run_parser.add_argument('--out', required=True, help='directory to write trajectories and summary.csv to')
+	run_parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per core)')
+	run_parser.add_argument('--particles', type=int, default=None, help='particles per filter')
+	run_parser.add_argument('--seed', type=int, default=0, help='random seed of the first run')
+	run_parser.add_argument('--cache-dir', default=None, help='where to keep occupancy fields')
+	run_parser.add_argument('--telemetry', action='store_true', help='record every update of every run')
+	for kind in ENGINE_KINDS:
+		run_parser.add_argument('--' + kind.replace('_', '-'), choices=available(kind), default=None,
+								help='the %s engine (the filter default when omitted)' % kind.replace('_', ' '))
+	convert_parser = commands.add_parser('convert', help='make a run from a bag file')
+	convert_parser.add_argument('bag')
+	convert_parser.add_argument('out')
+	convert_parser.add_argument('--scan-topic', default='scan')
+	convert_parser.add_argument('--odom-topic', default='odom')
+	convert_parser.add_argument('--map', default=None, help='map YAML file to store with the run')
+	args = parser.parse_args()
+
+	if args.command == 'run':
+		engines = dict((kind, getattr(args, kind)) for kind in ENGINE_KINDS if getattr(args, kind) != None)
+		run_batch(args.runs, args.map, args.out, args.processes, args.particles, args.seed, args.cache_dir, args.telemetry,
+				  engines)
+	else:
+		convert_bag(args.bag, args.out, args.scan_topic, args.odom_topic, args.map)
@@ -0,0 +1,9 @@
+""" Particle filter localization for the neato.
+
+	core: the ROS-free filter (ParticleFilterCore)
+	engines: the pluggable motion models, sensor models, resamplers and pose estimators
+	occupancy_field: the distance field the sensor models score against
+	node: the ROS node around the core, run by scripts/pf_level1.py and scripts/pf_level2.py
+	The rest are the pieces the core is built from (kernels, scan matcher, update scheduler, ...).  Nothing is
+	imported here so that loading a single module stays cheap.
+"""
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+""" Recovery from localization failures for the particle filter (Augmented MCL, Probabilistic Robotics p 258). """
+
+import numpy as np
+
+class AugmentedMCL:
+	""" Tracks short and long term averages of the measurement likelihood.  When the short term average drops
+		below the long term one the filter has likely lost track of the robot, and random particles are injected
+		in proportion to how far it dropped.
+		Attributes:
+			alpha_slow: decay rate of the long term average (alpha_slow << alpha_fast)
+			alpha_fast: decay rate of the short term average
+			w_slow: the long term average of the mean particle likelihood (None until the first update)
+			w_fast: the short term average of the mean particle likelihood (None until the first update)
+	"""
+
+	def __init__(self, alpha_slow=0.001, alpha_fast=0.1):
+		self.alpha_slow = alpha_slow
+		self.alpha_fast = alpha_fast
+		self.reset()
+
+	def reset(self):
+		""" Forget the likelihood history """
+		self.w_slow = None
+		self.w_fast = None
+
+	def update(self, likelihoods):
+		""" Fold in the likelihoods the sensor model assigned to each particle in the latest update """
+		w_avg = float(np.mean(likelihoods))
+		if not np.isfinite(w_avg):
+			return
+		if self.w_slow == None:
+			self.w_slow = w_avg
+			self.w_fast = w_avg
+		else:
+			self.w_slow += self.alpha_slow*(w_avg - self.w_slow)
+			self.w_fast += self.alpha_fast*(w_avg - self.w_fast)
+
+	def injection_probability(self):
+		""" The probability with which each resampled particle should be replaced by a random one """
+		if self.w_slow == None or not(self.w_slow > 0):
+			return 0.0
+		return max(0.0, 1.0 - self.w_fast/self.w_slow)
+
+	def injection_count(self, n):
+		""" Draw how many of n resampled particles should be replaced by random ones """
+		return int(np.random.binomial(n, self.injection_probability()))
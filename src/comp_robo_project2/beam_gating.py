@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+""" Gates out laser beams that the map can't explain before the sensor model sees them.
+
+	People and carts show up as readings that are much shorter than the wall the map puts behind them.  The
+	likelihood field model penalizes those beams by the cube of their distance to the nearest obstacle for every
+	particle, which slows convergence and costs time without telling us anything about where we are.  Once the cloud
+	has settled, every beam is compared against the range the map predicts from the current pose estimate and the
+	ones that come back short are left out of the per-particle scoring.
+"""
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from comp_robo_project2 import se2
+
+class BeamGate:
+	""" Classifies the beams of a scan as map-consistent or dynamic
+		Attributes:
+			occupancy_field: the OccupancyField the expected ranges are cast in
+			kernels: the kernel backend used for ray casting (see pf_kernels)
+			max_range: the range of the laser, expected ranges are capped at it
+			n_directions: the number of directions expected ranges are cast in from each cell
+			margin: how much shorter than expected (in meters) a reading has to be to count as dynamic
+			max_spread: the cloud's position spread (in meters) above which the pose estimate isn't trusted and
+						nothing is gated
+			max_heading_variance: the circular variance of the cloud's headings above which nothing is gated
+			max_gated_fraction: when more than this fraction of a scan looks dynamic the estimate is more likely wrong
+								than the world full of people, so nothing is gated
+			max_cells: the number of cells whose expected ranges are kept
+			expected: the expected ranges in every direction for each cell cast so far, keyed by cell index
+	"""
+
+	def __init__(self, occupancy_field, kernels, max_range, n_directions=360, margin=0.3, max_spread=0.5,
+				 max_heading_variance=0.05, max_gated_fraction=0.5, max_cells=4096):
+		self.occupancy_field = occupancy_field
+		self.kernels = kernels
+		self.max_range = max_range
+		self.n_directions = n_directions
+		self.margin = margin
+		self.max_spread = max_spread
+		self.max_heading_variance = max_heading_variance
+		self.max_gated_fraction = max_gated_fraction
+		self.max_cells = max_cells
+		self.expected = OrderedDict()
+		self._directions = np.arange(n_directions)*(2*math.pi/n_directions)
+
+	def expected_ranges(self, x, y):
+		""" The ranges the map predicts in each of n_directions headings (starting at 0, counter clockwise) from the
+			center of the cell containing (x,y).  Results are cached per cell """
+		field = self.occupancy_field
+		cell_x = int(math.floor((x - field.origin.position.x)/field.resolution))
+		cell_y = int(math.floor((y - field.origin.position.y)/field.resolution))
+		key = (cell_x, cell_y)
+		ranges = self.expected.get(key)
+		if ranges is None:
+			center_x = field.origin.position.x + (cell_x + 0.5)*field.resolution
+			center_y = field.origin.position.y + (cell_y + 0.5)*field.resolution
+			ranges = self.kernels.calc_range(np.full(self.n_directions, center_x), np.full(self.n_directions, center_y),
+											 self._directions, field.occupied_grid,
+											 (field.origin.position.x, field.origin.position.y), field.resolution,
+											 self.max_range)
+			if len(self.expected) >= self.max_cells:
+				self.expected.popitem(last=False)
+			self.expected[key] = ranges
+		return ranges
+
+	def gate(self, angles, ranges, x, y, theta, weights=None):
+		""" Classify the beams (angles, ranges) of a scan given the particle cloud (x, y, theta, weights).
+			Returns a boolean array that is True for the beams that should be scored, and the fraction of beams
+			that were gated out """
+		consistent = np.ones(len(ranges), dtype=bool)
+		if len(ranges) == 0 or len(x) == 0:
+			return consistent, 0.0
+		# only trust the pose estimate once the cloud has settled on one place and heading
+		mean_x, mean_y, mean_theta = se2.mean_pose(x, y, theta, weights)
+		if weights is None:
+			spread = math.sqrt(np.mean((x - mean_x)**2 + (y - mean_y)**2))
+		else:
+			spread = math.sqrt(np.dot(weights, (x - mean_x)**2 + (y - mean_y)**2)/np.sum(weights))
+		if spread > self.max_spread or se2.circular_variance(theta, weights) > self.max_heading_variance:
+			return consistent, 0.0
+
+		step = 2*math.pi/self.n_directions
+		directions = np.round(se2.wrap_positive(mean_theta + np.asarray(angles))/step).astype(np.intp) % self.n_directions
+		expected = self.expected_ranges(mean_x, mean_y)[directions]
+		consistent = ranges >= expected - self.margin
+		gated = 1.0 - np.mean(consistent)
+		if gated > self.max_gated_fraction:
+			return np.ones(len(ranges), dtype=bool), 0.0
+		return consistent, gated
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+
+""" The particle filter without ROS: scans go in as arrays of ranges along with the odometry pose they were taken
+	at, and the estimated pose comes out as an (x,y,theta) tuple.
+
+	The filter keeps the cloud as x, y, theta and w arrays and runs the four stages that vary between
+	implementations (motion model, sensor model, resampling and pose estimation) through the engines it is
+	configured with (see engines).  The live node (see node), the offline batch runner and the benchmarks all wrap
+	this class, so they localize the same way.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from comp_robo_project2 import se2
+from comp_robo_project2.engines import ENGINE_KINDS, create
+from comp_robo_project2.scan_matcher import CorrelativeScanMatcher, CandidateSearch
+from comp_robo_project2.update_scheduler import UpdateScheduler
+from comp_robo_project2.augmented_mcl import AugmentedMCL
+from comp_robo_project2.pf_kernels import get_backend, warm_up
+from comp_robo_project2.telemetry import StageTimer
+from comp_robo_project2.beam_gating import BeamGate
+from comp_robo_project2.hypotheses import HypothesisClusters
+
+# the engines of the level 1 filter
+DEFAULT_ENGINES = {'motion_model': 'odometry', 'sensor_model': 'likelihood_field', 'resampler': 'multinomial',
+				   'pose_estimator': 'top_fraction'}
+
+class ParticleFilterCore:
+	""" A particle filter that localizes in an OccupancyField
+		Attributes:
+			n_particles: the number of particles in the filter
+			d_thresh: the amount of linear movement before triggering a filter update
+			a_thresh: the amount of angular movement before triggering a filter update
+			laser_max_distance: the maximum distance to an obstacle we should use in a likelihood calculation
+			laser_max_range: the maximum range of the laser, readings this long carry no information
+			occupancy_field: the OccupancyField of the map we are localizing in (None until set_map)
+			scan_matcher: correlative scan matcher used to seed the particle cloud from a scan
+			candidate_search: keeps the scan matcher candidates recovery particles are drawn around (see CandidateSearch)
+			background_search: if True the searches for recovery candidates run in a background thread, so a scan never
+							   waits for one.  The particles that should have gone around the candidates are drawn from
+							   the free cells in the meantime, and owed until the search finishes
+			recovery_search: the number of the candidate search recovery particles are owed from (None when none are)
+			recovery_owed: how many recovery particles are owed from recovery_search
+			seed_with_scan_matcher: if True, initialization and recovery particles are drawn around scan matcher candidates
+									instead of uniformly over the unoccupied cells of the map
+			n_seed_candidates: the number of scan matcher candidates to seed particles around
+			seeded_recovery_fraction: the share of the recovery particles drawn around scan matcher candidates, the rest
+									  are always drawn uniformly from the free cells so recovery never depends on the
+									  scan matcher alone
+			x, y, theta, w: the pose and weight of every particle as numpy arrays (None until the cloud is initialized)
+			roughening: standard deviation of the noise (x and y in meters, theta in radians) added to the resampled
+						particles, so that a motion model without noise of its own doesn't collapse the cloud onto a
+						few poses
+			score_memo: if True, particles that fall in the same grid cell and heading bin share a sensor model score
+						(resampling piles particles up around the best poses, so most of them have a neighbor to share with)
+			memo_heading_bins: the number of heading bins used by the score memo
+			gate_dynamic_beams: if True, beams that come back much shorter than the map predicts from the current pose
+								estimate (people, carts) are left out of the sensor model
+			beam_gate: the BeamGate that classifies beams (None when gate_dynamic_beams is off)
+			odom_xy_theta: the pose of the robot in the odometry frame at the time of the latest scan (x,y,theta)
+			current_odom_xy_theta: the pose of the robot in the odometry frame when the last filter update was performed
+			robot_xy_theta: the estimated pose of the robot in the map (x,y,theta), None until the cloud is initialized
+			scheduler: decides whether a scan triggers a full update, a weight-only update or nothing, and whether to resample
+			recovery: tracks short and long term average likelihoods to decide how many random particles to inject
+			kernel_backend: which implementation of the motion, sensor, resampling and ray casting kernels to use
+							('numpy', 'numba', or 'auto' to use numba when it is installed)
+			kernels: the loaded kernel backend (see pf_kernels)
+			engine_names: the name of the engine used for each engine kind (see engines)
+			engines: the engine of each kind, built from engine_names
+			clusters: the HypothesisClusters of the cloud, shared by the engines that use them (see cluster)
+			cloud_version: counts the changes to the cloud, so that it is only clustered once per change
+			telemetry: a TelemetryRecorder every update is recorded to, or None
+	"""
+
+	def __init__(self, occupancy_field=None, n_particles=200, d_thresh=0.1, a_thresh=math.pi/12, laser_max_distance=2.0,
+				 laser_max_range=6.0, kernel_backend='auto', light_fraction=0.5, resample_threshold=0.1, engines=None):
+		""" occupancy_field: the OccupancyField to localize in (can also be given later with set_map)
+			engines: the names of the engines to use, by kind (DEFAULT_ENGINES for the kinds that are left out)
+			light_fraction, resample_threshold: passed on to the scheduler (see UpdateScheduler)
+			The rest of the arguments set the attributes of the same name """
+		self.n_particles = n_particles
+		self.d_thresh = d_thresh
+		self.a_thresh = a_thresh
+		self.laser_max_distance = laser_max_distance
+		self.laser_max_range = laser_max_range
+
+		self.seed_with_scan_matcher = True	# seed initialization and recovery from scan matcher candidates
+		self.n_seed_candidates = 10			# the number of scan matcher candidates to seed particles around
+		self.seeded_recovery_fraction = 0.5	# the rest of the recovery particles come from the free cells
+		self.background_search = True		# don't hold up scans while the scan matcher searches the whole map
+
+		self.x = self.y = self.theta = self.w = None
+		self.roughening = (0.05, 0.05, 0.05)	# x, y (m) and theta (rad) noise added to the resampled cloud
+		self.score_memo = True				# reuse scores of particles in the same grid cell and heading bin
+		self.memo_heading_bins = 72			# 5 degree heading bins for the score memo
+		self.gate_dynamic_beams = True		# don't score beams that hit things that aren't on the map
+
+		self.odom_xy_theta = None
+		self.current_odom_xy_theta = None
+		self.robot_xy_theta = None
+
+		# full updates happen past d_thresh / a_thresh, weight-only updates past light_fraction of them, and
+		# resampling only when the effective sample size drops below resample_threshold of the cloud.  The likelihood
+		# field's 1/mean(d^3) weights are peaked enough that the ESS ratio is almost always under the usual 0.5, hence
+		# the low default
+		self.scheduler = UpdateScheduler(self.d_thresh, self.a_thresh, light_fraction, resample_threshold)
+		# random particles are only injected when the short term likelihood average falls below the long term one
+		self.recovery = AugmentedMCL(alpha_slow=0.001, alpha_fast=0.1)
+
+		self.kernel_backend = kernel_backend
+		self.kernels = get_backend(self.kernel_backend)
+		warm_up(self.kernels)
+
+		self.clusters = HypothesisClusters(radius=0.5, angular_radius=math.pi/4, prune_weight=0.02, max_clusters=5,
+										   min_particles=10)
+		self.cloud_version = 0
+		self._clustered_version = None
+
+		self.engine_names = dict(DEFAULT_ENGINES)
+		self.engines = {}
+		self.set_engines(**(engines or {}))
+
+		self.telemetry = None
+		self.occupancy_field = None
+		self.scan_matcher = None
+		self.candidate_search = None
+		self.recovery_search = None
+		self.recovery_owed = 0
+		self.beam_gate = None
+		if occupancy_field != None:
+			self.set_map(occupancy_field)
+
+	def set_engines(self, **names):
+		""" Switch the engines of the kinds given as keyword arguments (e.g. resampler='systematic') to the ones
+			registered under those names """
+		for kind in names:
+			if kind not in ENGINE_KINDS:
+				raise ValueError("unknown engine kind '%s' (expected one of %s)" % (kind, ', '.join(ENGINE_KINDS)))
+		self.engine_names.update(names)
+		for kind in ENGINE_KINDS:
+			if kind in names or kind not in self.engines:
+				self.engines[kind] = create(kind, self.engine_names[kind], self)
+
+	def set_map(self, occupancy_field, scan_matcher=None, beam_gate=None):
+		""" Localize in occupancy_field from now on, building the scan matcher (and beam gate) for it.  A scan_matcher
+			and beam_gate already built for the same field can be passed in instead, since building them is most of
+			the setup on a big map """
+		self.occupancy_field = occupancy_field
+		self.scan_matcher = scan_matcher if scan_matcher != None else CorrelativeScanMatcher(self.occupancy_field)
+		self.candidate_search = CandidateSearch(self.scan_matcher, k=self.n_seed_candidates,
+												background=self.background_search)
+		self.recovery_search = None
+		self.recovery_owed = 0
+		self.beam_gate = None
+		if self.gate_dynamic_beams:
+			self.beam_gate = beam_gate if beam_gate != None else BeamGate(self.occupancy_field, self.kernels,
+																		  self.laser_max_range)
+
+	def has_cloud(self):
+		""" True once the particle cloud has been initialized """
+		return self.x is not None
+
+	def valid_beams(self, ranges):
+		""" Returns the bearing and range of each beam of a 360 beam scan (ranges) that has a usable reading as two
+			numpy arrays """
+		ranges = np.asarray(ranges, dtype=np.float64)
+		angles = np.arange(len(ranges))/360.0*2*math.pi
+		valid = (ranges < self.laser_max_range) & (ranges > .2)
+		return angles[valid], ranges[valid]
+
+	def process_scan(self, ranges, odom_xy_theta):
+		""" Run the filter on a scan (its ranges), taken when the robot was at odom_xy_theta in the odometry frame.
+			The cloud is initialized from the first scan.  Returns the scheduler's decision for the scan """
+		self.odom_xy_theta = odom_xy_theta
+		if not self.has_cloud():
+			self.initialize(ranges=ranges)
+			# cache the last odometric pose so we can only update our particle filter if we move more than self.d_thresh or self.a_thresh
+			self.current_odom_xy_theta = odom_xy_theta
+
+		decision = self.scheduler.decide(self.current_odom_xy_theta, odom_xy_theta)
+		timer = StageTimer()
+		cloud = ess = None
+		if decision != UpdateScheduler.SKIP:
+			angles, valid_ranges = self.valid_beams(ranges)
+			self.update_with_odom()
+			timer.lap('odom')
+			self.update_with_laser(angles, valid_ranges)
+			timer.lap('laser')
+			# the weighted cloud the update ended with (resampling replaces the arrays rather than changing them)
+			cloud = (self.x, self.y, self.theta, self.w)
+		if decision == UpdateScheduler.FULL:
+			self.update_pose()
+			timer.lap('pose')
+			# resample when the cloud has degenerated, when augmented MCL wants to inject recovery particles, or
+			# when the candidates owed recovery particles were waiting for are in
+			if (self.scheduler.should_resample(self.w, self.distinct_poses()) or
+				  self.recovery.injection_probability()*self.n_particles >= 1 or self.owed_candidates_ready()):
+				self.resample(angles, valid_ranges)
+			timer.lap('resample')
+			ess = self.scheduler.metrics['ess']
+		# a weight-only update folds in the motion and the scan so far, but leaves the pose estimate and resampling
+		# to the next full update
+		if decision != UpdateScheduler.SKIP and self.telemetry != None:
+			self.record_telemetry(decision, timer.times, cloud, ess)
+		return decision
+
+	def initialize(self, xy_theta=None, ranges=None):
+		""" Initialize the particle cloud.
+			xy_theta: a triple consisting of the mean x, y, and theta (yaw) to initialize the particle cloud around.
+					  If this input is ommitted, the whole map is searched
+			ranges: a scan used to place the particles around the best scan matcher candidates """
+		poses = None
+		if self.seed_with_scan_matcher and ranges is not None:
+			# refine the guess (or search the whole map when there is none) with the scan matcher
+			angles, valid_ranges = self.valid_beams(ranges)
+			poses = self.seeded_poses(self.n_particles, angles, valid_ranges, xy_theta)
+		if poses is None:
+			if xy_theta is None:
+				# When no guess given, initialize paricle cloud by random points in known unocupied portion of map
+				poses = self.random_poses(self.n_particles)
+			else:
+				poses = (np.random.normal(xy_theta[0], 1, self.n_particles), np.random.normal(xy_theta[1], 1, self.n_particles),
+						 se2.wrap_positive(np.random.normal(xy_theta[2], 1.5, self.n_particles)))
+		self.x, self.y, self.theta = poses
+		self.w = np.ones(len(self.x))
+		self.cloud_version += 1
+		self.update_pose()
+
+	def update_with_odom(self):
+		""" Move the particles by the change in odometry since the last update (to odom_xy_theta) """
+		new_odom_xy_theta = self.odom_xy_theta
+		if self.current_odom_xy_theta is None:
+			self.current_odom_xy_theta = new_odom_xy_theta
+			return
+		old_odom_xy_theta = self.current_odom_xy_theta
+		self.current_odom_xy_theta = new_odom_xy_theta
+
+		self.engines['motion_model'].move(self.x, self.y, self.theta, old_odom_xy_theta, new_odom_xy_theta)
+		self.cloud_version += 1
+
+	def update_with_laser(self, angles, ranges):
+		""" Update the particle weights with the valid beams (angles, ranges) of a scan """
+		# leave out the beams that hit something the map doesn't know about
+		if self.beam_gate != None:
+			consistent, gated = self.beam_gate.gate(angles, ranges, self.x, self.y, self.theta, self.w)
+			angles = angles[consistent]
+			ranges = ranges[consistent]
+			self.scheduler.metrics['gated_fraction'] = gated
+
+		likelihoods = self.score_particles(self.x, self.y, self.theta, angles, ranges)
+		# weights accumulate across updates since resampling only happens once the cloud degenerates
+		self.w *= likelihoods
+		self.recovery.update(likelihoods)
+		self.normalize()
+		self.cloud_version += 1
+
+	def score_particles(self, x, y, theta, angles, ranges):
+		""" Runs the sensor model on the particle poses x, y, theta.  With score_memo turned on, particles in the same
+			grid cell and heading bin are only scored once and share the score.  Returns the likelihood of every
+			particle """
+		n = len(x)
+		# indices of the particles that actually get scored, and for every particle which of those it copies
+		scored = np.arange(n)
+		copies = np.arange(n)
+		if self.score_memo and n > 0:
+			# hash each pose to its cell and heading bin (everything off the map shares the border cells)
+			res = self.occupancy_field.resolution
+			width = self.occupancy_field.map.info.width
+			height = self.occupancy_field.map.info.height
+			cells_x = np.clip(np.floor((x - self.occupancy_field.origin.position.x)/res), -1, width).astype(np.int64) + 1
+			cells_y = np.clip(np.floor((y - self.occupancy_field.origin.position.y)/res), -1, height).astype(np.int64) + 1
+			bins = np.floor(se2.wrap_positive(theta)/(2*math.pi)*self.memo_heading_bins).astype(np.int64)
+			keys = (cells_x*(height + 2) + cells_y)*(self.memo_heading_bins + 1) + bins
+			unique_keys, scored, copies = np.unique(keys, return_index=True, return_inverse=True)
+
+		likelihoods = self.engines['sensor_model'].score(x[scored], y[scored], theta[scored], angles, ranges)
+		self.scheduler.metrics['scored_fraction'] = float(len(scored))/n if n else float('nan')
+		return likelihoods[copies]
+
+	def normalize(self):
+		""" Make sure the particle weights define a valid distribution (i.e. sum to 1.0)"""
+		self.w /= np.sum(self.w)
+
+	def update_pose(self):
+		""" Update the estimate of the robot's pose (robot_xy_theta) from the particles with the pose estimator """
+		pose = self.engines['pose_estimator'].estimate(self.x, self.y, self.theta, self.w)
+		if pose is None:
+			self.robot_xy_theta = (0.0, 0.0, 0.0)
+			return
+		self.robot_xy_theta = (float(pose[0]), float(pose[1]), float(se2.wrap_positive(pose[2])))
+
+	def resample(self, angles=None, ranges=None):
+		""" Resample the particles according to their weights with the resampler, replacing as many of them as
+			augmented MCL asks for with recovery particles (drawn around scan matcher candidates for the valid beams
+			angles, ranges when they are given) """
+		# Only resample as many particles from the current pool as augmented MCL thinks we are still localized
+		n_random = self.recovery.injection_count(self.n_particles)
+		if n_random > 0:
+			# start the averages over so that one bad stretch doesn't keep flooding the cloud with random particles
+			self.recovery.reset()
+		n_owed = 0
+		if self.owed_candidates_ready():
+			n_owed = min(self.recovery_owed, self.n_particles - n_random)
+			self.recovery_search = None
+			self.recovery_owed = 0
+
+		drawn, drawn_w = self.engines['resampler'].draw(self.x, self.y, self.theta, self.w,
+														self.n_particles - n_random - n_owed)
+		kept_w = np.ones(len(drawn)) if drawn_w is None else drawn_w
+		kept_x, kept_y, kept_theta = self.x[drawn], self.y[drawn], self.theta[drawn]
+		if np.any(self.roughening):
+			# spread the copies out so the cloud keeps covering the poses around the ones that survived
+			kept_x = kept_x + np.random.normal(0, self.roughening[0], len(drawn))
+			kept_y = kept_y + np.random.normal(0, self.roughening[1], len(drawn))
+			kept_theta = se2.wrap_positive(kept_theta + np.random.normal(0, self.roughening[2], len(drawn)))
+
+		# Pick the remaining particles around scan matcher candidates (or randomly from known unoccupied
+		# cells of map), then combine with the ones chosen by the resampler
+		recovery_x, recovery_y, recovery_theta = self.recovery_poses(n_random, angles, ranges)
+		if n_owed > 0:
+			owed = self.candidate_poses(n_owed, self.candidate_search.latest(self.odom_xy_theta))
+			if owed is None:
+				owed = self.random_poses(n_owed)
+			recovery_x, recovery_y, recovery_theta = [np.concatenate(pair) for pair in
+													  zip((recovery_x, recovery_y, recovery_theta), owed)]
+		self.x = np.concatenate((kept_x, recovery_x))
+		self.y = np.concatenate((kept_y, recovery_y))
+		self.theta = np.concatenate((kept_theta, recovery_theta))
+
+		# the resampled cloud represents the distribution by particle density, so start over with uniform weights
+		# (unless the resampler says otherwise)
+		self.w = np.concatenate((kept_w, np.ones(len(recovery_x))))
+		self.cloud_version += 1
+
+	def distinct_poses(self):
+		""" The index of the distinct pose every particle is at (copies of the same particle share an index) """
+		if len(self.x) == 0:
+			return np.zeros(0, dtype=np.intp)
+		return np.unique(np.column_stack((self.x, self.y, self.theta)), axis=0, return_inverse=True)[1]
+
+	def random_poses(self, number):
+		""" number poses drawn uniformly from the unoccupied portion of the map, as x, y and theta arrays """
+		res = self.occupancy_field.resolution
+		free_cells = self.occupancy_field.free_cells
+		if number <= 0 or len(free_cells) == 0:
+			return np.empty(0), np.empty(0), np.empty(0)
+		cells = free_cells[np.random.randint(0, len(free_cells), number)]
+		return (cells[:,0]*res + self.occupancy_field.origin.position.x,
+				cells[:,1]*res + self.occupancy_field.origin.position.y,
+				np.random.uniform(0, 2*math.pi, number))
+
+	def recovery_poses(self, number, angles=None, ranges=None):
+		""" Poses to reinject into the cloud. seeded_recovery_fraction of them are drawn around the best scan matcher
+			candidates for the valid beams angles, ranges when possible, and the rest (all of them otherwise) uniformly
+			from the unoccupied portion of the map.  When the search for candidates runs in the background and hasn't
+			finished yet, those particles are drawn from the free cells as well and the search owes them to the cloud
+			(see owed_candidates_ready) """
+		n_seeded = 0
+		if self.seed_with_scan_matcher and ranges is not None and self.odom_xy_theta is not None:
+			n_seeded = int(round(number*self.seeded_recovery_fraction))
+		seeded = None
+		if n_seeded > 0:
+			search = self.candidate_search.request(angles, ranges, self.odom_xy_theta)
+			if self.candidate_search.answered(search):
+				seeded = self.candidate_poses(n_seeded, self.candidate_search.latest(self.odom_xy_theta))
+			else:
+				self.recovery_search = search
+				self.recovery_owed = min(self.recovery_owed + n_seeded, self.n_particles)
+		if seeded is None:
+			n_seeded = 0
+			seeded = (np.empty(0), np.empty(0), np.empty(0))
+		uniform = self.random_poses(number - n_seeded)
+		return tuple(np.concatenate((s, u)) for s, u in zip(seeded, uniform))
+
+	def seeded_poses(self, number, angles, ranges, xy_theta=None):
+		""" number poses around the ones that best explain the valid beams (angles, ranges) of a scan according to the
+			scan matcher, as x, y and theta arrays.  If xy_theta is given only the neighborhood of that pose is
+			searched.  Returns None if the scan matcher did not find any candidates """
+		if xy_theta is None:
+			candidates = self.scan_matcher.match(angles, ranges, k=self.n_seed_candidates)
+		else:
+			candidates = self.scan_matcher.match(angles, ranges, k=self.n_seed_candidates, center=xy_theta,
+												 linear_window=1.0, angular_window=math.pi/4)
+		return self.candidate_poses(number, candidates)
+
+	def owed_candidates_ready(self):
+		""" True when recovery particles are owed from a background search for candidates that has finished """
+		return self.recovery_search is not None and self.candidate_search.answered(self.recovery_search)
+
+	def candidate_poses(self, number, candidates):
+		""" number poses around scan matcher candidates (x, y, theta, score), as x, y and theta arrays.  Returns None
+			if there are no candidates """
+		if not candidates:
+			return None
+
+		# split the particles among the candidates in proportion to their scores
+		scores = np.array([c[3] for c in candidates])
+		counts = np.random.multinomial(number, scores/np.sum(scores))
+		res = self.scan_matcher.resolution
+		centers = np.array([c[:3] for c in candidates])[np.repeat(np.arange(len(candidates)), counts)]
+		return (np.random.normal(centers[:,0] + res/2.0, res),
+				np.random.normal(centers[:,1] + res/2.0, res),
+				se2.wrap_positive(np.random.normal(centers[:,2], self.scan_matcher.angular_step)))
+
+	def map_calc_range(self,x,y,theta):
+		""" Ray traces from (x,y) along heading theta and returns the distance to the first obstacle in the map
+			(or self.laser_max_range if the ray leaves the map or doesn't hit anything) """
+		return float(self.kernels.calc_range(np.array([x], dtype=np.float64), np.array([y], dtype=np.float64),
+											 np.array([theta], dtype=np.float64), self.occupancy_field.occupied_grid,
+											 self.occupancy_field.origin_xy(), self.occupancy_field.resolution,
+											 self.laser_max_range)[0])
+
+	def cluster(self, x, y, theta, weights):
+		""" Cluster the particles x, y, theta, weights into hypotheses and return the (shared) HypothesisClusters.
+			The filter's own cloud is only clustered again once it has changed, so the pose estimator and the
+			resampler of the same update share one clustering """
+		own = x is self.x and y is self.y and theta is self.theta and weights is self.w
+		if not own or self._clustered_version != self.cloud_version:
+			self.clusters.update(x, y, theta, weights)
+			self._clustered_version = self.cloud_version if own else None
+		return self.clusters
+
+	def hypotheses(self):
+		""" The HypothesisClusters of the cloud, None when none of the engines clusters it """
+		if any(engine.uses_clusters for engine in self.engines.values()):
+			return self.clusters
+		return None
+
+	def record_telemetry(self, decision, stage_times, cloud, ess=None):
+		""" Hand the state of the filter after an update to the telemetry recorder.  cloud is the x, y, theta and
+			weights of the particles before resampling, and ess the effective sample size the resampling decision was
+			made on (worked out from the weights when there was no decision to make) """
+		x, y, theta, weights = cloud
+		pose = self.robot_xy_theta
+		if ess is None:
+			ess = UpdateScheduler.effective_sample_size(weights)
+		columns = dict(('seconds_' + name, seconds) for name, seconds in stage_times.items())
+		self.telemetry.record(wall_time=time.time(), scan=self.scheduler.metrics['scans'], decision=decision,
+							  x=x, y=y, theta=theta, w=weights, ess=ess,
+							  pose_x=pose[0], pose_y=pose[1], pose_theta=pose[2], **columns)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+""" Pluggable implementations of the four stages of the particle filter.
+
+	Each stage is an engine kind:
+		motion_model: moves the particles by the change in odometry (move)
+		sensor_model: the likelihood of a scan from each particle pose (score)
+		resampler: picks which particles survive resampling (draw)
+		pose_estimator: turns the cloud into a single robot pose (estimate)
+	Engines register themselves under a name with the register decorator, and the filter core builds the ones it is
+	configured with by name (see ParticleFilterCore.set_engines), so that an alternative can be picked with a ROS
+	parameter or a benchmark flag without touching the filter.  Every engine is constructed with the core it runs in
+	and reads the map, kernels and laser settings from it when it is called, so engines never go stale when the map
+	changes.  Particles are passed around as x, y, theta and weight arrays.
+"""
+
+import math
+
+import numpy as np
+from numpy.random import random_sample
+
+from comp_robo_project2 import se2
+from comp_robo_project2.update_scheduler import UpdateScheduler
+
+ENGINE_KINDS = ('motion_model', 'sensor_model', 'resampler', 'pose_estimator')
+
+_registry = dict((kind, {}) for kind in ENGINE_KINDS)
+
+def register(kind, name):
+	""" Class decorator that makes the decorated engine available as name for the engine kind """
+	if kind not in _registry:
+		raise ValueError("unknown engine kind '%s' (expected one of %s)" % (kind, ', '.join(ENGINE_KINDS)))
+	def decorate(cls):
+		cls.name = name
+		_registry[kind][name] = cls
+		return cls
+	return decorate
+
+def available(kind):
+	""" The names of the registered engines of kind, sorted """
+	return sorted(_registry[kind])
+
+def create(kind, name, core):
+	""" Build the engine registered as name for kind to run in core """
+	if kind not in _registry:
+		raise ValueError("unknown engine kind '%s' (expected one of %s)" % (kind, ', '.join(ENGINE_KINDS)))
+	if name not in _registry[kind]:
+		raise ValueError("unknown %s '%s' (available: %s)" % (kind, name, ', '.join(available(kind))))
+	return _registry[kind][name](core)
+
+class Engine:
+	""" Base class of the engines
+		Attributes:
+			core: the ParticleFilterCore the engine runs in
+			name: the name the engine is registered under
+			uses_clusters: True for engines that work from the core's hypothesis clusters (see ParticleFilterCore.cluster)
+	"""
+
+	name = None
+	uses_clusters = False
+
+	def __init__(self, core):
+		self.core = core
+
+# motion models: move(x, y, theta, old_xy_theta, new_xy_theta) updates the particle arrays in place
+
+@register('motion_model', 'odometry')
+class OdometryMotion(Engine):
+	""" Rotates the change in odometry into each particle's heading and applies it exactly.  The only spread the
+		cloud gets is the core's roughening after resampling """
+
+	def move(self, x, y, theta, old_xy_theta, new_xy_theta):
+		delta = UpdateScheduler.wrapped_delta(old_xy_theta, new_xy_theta)
+		self.core.kernels.motion(x, y, theta, delta, old_xy_theta[2], self.core.occupancy_field.bounds())
+
+@register('motion_model', 'sample_odometry')
+class SampleOdometryMotion(Engine):
+	""" sample_motion_odometry (Prob Rob p 136): the change in odometry is split into a rotation, a translation and a
+		second rotation, and every particle gets its own noisy copy of each
+		Attributes:
+			alphas: (a1, a2, a3, a4) noise of rotation from rotation, rotation from translation, translation from
+					translation and translation from rotation
+	"""
+
+	def __init__(self, core):
+		Engine.__init__(self, core)
+		self.alphas = (0.05, 0.05, 0.05, 0.01)
+
+	def move(self, x, y, theta, old_xy_theta, new_xy_theta):
+		a1, a2, a3, a4 = self.alphas
+		n = len(x)
+		dx = new_xy_theta[0] - old_xy_theta[0]
+		dy = new_xy_theta[1] - old_xy_theta[1]
+		trans = math.hypot(dx, dy)
+		# turning in place gives no direction of travel to rotate towards
+		rot1 = float(se2.diff(math.atan2(dy, dx), old_xy_theta[2])) if trans > 1e-6 else 0.0
+		rot2 = float(se2.diff(new_xy_theta[2] - old_xy_theta[2], rot1))
+
+		rot1_hat = rot1 - np.random.normal(0, math.sqrt(a1*rot1**2 + a2*trans**2), n)
+		trans_hat = trans - np.random.normal(0, math.sqrt(a3*trans**2 + a4*(rot1**2 + rot2**2)), n)
+		rot2_hat = rot2 - np.random.normal(0, math.sqrt(a1*rot2**2 + a2*trans**2), n)
+
+		x += trans_hat*np.cos(theta + rot1_hat)
+		y += trans_hat*np.sin(theta + rot1_hat)
+		theta += rot1_hat + rot2_hat
+		se2.wrap_positive(theta, out=theta)
+		min_x, max_x, min_y, max_y = self.core.occupancy_field.bounds()
+		np.clip(x, min_x, max_x, out=x)
+		np.clip(y, min_y, max_y, out=y)
+
+# sensor models: score(x, y, theta, angles, ranges) returns the likelihood of the beams from every pose
+
+@register('sensor_model', 'likelihood_field')
+class LikelihoodFieldSensor(Engine):
+	""" Projects every beam from every particle into the map and scores it by the cube of its distance to the closest
+		obstacle (capped at the core's laser_max_distance) """
+
+	def score(self, x, y, theta, angles, ranges):
+		field = self.core.occupancy_field
+		return self.core.kernels.score(x, y, theta, angles, ranges, field.distance_grid, field.origin_xy(),
+									   field.resolution, self.core.laser_max_distance)
+
+@register('sensor_model', 'beam')
+class BeamSensor(Engine):
+	""" Ray casting beam model: the range the map predicts for each beam from each particle is compared with the
+		reading.  Much slower than the likelihood field (every beam is cast from every particle), but it knows
+		about walls that hide other walls
+		Attributes:
+			n_beams: at most this many beams (spread evenly over the scan) are cast per particle
+			sigma: standard deviation of a reading around the predicted range (in meters)
+			random_weight: the share of readings that are unexplained noise, spread evenly over the laser's range
+			chunk_rays: at most this many rays are cast at once, so the (particles x beams) arrays stay small for big
+						clouds
+	"""
+
+	def __init__(self, core):
+		Engine.__init__(self, core)
+		self.n_beams = 60
+		self.sigma = 0.1
+		self.random_weight = 0.1
+		self.chunk_rays = 1 << 16
+
+	def score(self, x, y, theta, angles, ranges):
+		n = len(x)
+		if len(ranges) > self.n_beams:
+			keep = np.linspace(0, len(ranges) - 1, self.n_beams).astype(np.intp)
+			angles = angles[keep]
+			ranges = ranges[keep]
+		m = len(ranges)
+		if m == 0:
+			return np.ones(n)
+		field = self.core.occupancy_field
+		max_range = self.core.laser_max_range
+		likelihoods = np.empty(n)
+		step = max(1, self.chunk_rays//m)
+		for start in range(0, n, step):
+			end = min(start + step, n)
+			expected = self.core.kernels.calc_range(np.repeat(x[start:end], m), np.repeat(y[start:end], m),
+													np.add.outer(theta[start:end], angles).ravel(), field.occupied_grid,
+													field.origin_xy(), field.resolution, max_range).reshape((end - start, m))
+			hit = np.exp(-0.5*((ranges - expected)/self.sigma)**2)/(self.sigma*math.sqrt(2*math.pi))
+			p = (1 - self.random_weight)*hit + self.random_weight/max_range
+			# the geometric mean over the beams keeps the product of many small numbers from underflowing
+			likelihoods[start:end] = np.exp(np.mean(np.log(p), axis=1))
+		return likelihoods
+
+# resamplers: draw(x, y, theta, weights, n) returns the indices of the n particles that are kept, and the weight each
+# of them starts over with (None when they all count the same)
+
+@register('resampler', 'multinomial')
+class MultinomialResampler(Engine):
+	""" n independent draws from the weights """
+
+	def draw(self, x, y, theta, weights, n):
+		return self.core.kernels.resample(normalized(weights), random_sample(n)), None
+
+@register('resampler', 'systematic')
+class SystematicResampler(Engine):
+	""" Low variance resampling (Prob Rob p 110): one random offset and n evenly spaced draws, so a particle with
+		weight w is kept either floor(n*w) or ceil(n*w) times """
+
+	def draw(self, x, y, theta, weights, n):
+		return self.core.kernels.resample(normalized(weights), (random_sample() + np.arange(n))/n), None
+
+@register('resampler', 'clustered')
+class ClusteredResampler(Engine):
+	""" Splits the cloud into hypothesis clusters, gives every cluster a budget in proportion to its weight and
+		resamples each cluster by the weights of its own particles.  Particles in dropped clusters are never drawn.
+		The particles of a cluster start over with its weight split among them, so a light cluster that got more
+		particles than its weight (see HypothesisClusters.budgets) doesn't gain weight from them
+		Attributes:
+			min_kept_weight: when the kept clusters hold less than this fraction of the weight, the whole cloud is
+							 resampled by its weights instead
+	"""
+
+	uses_clusters = True
+
+	def __init__(self, core):
+		Engine.__init__(self, core)
+		self.min_kept_weight = 0.5
+
+	def draw(self, x, y, theta, weights, n):
+		hypotheses = self.core.cluster(x, y, theta, weights)
+		weights = np.asarray(weights, dtype=np.float64)
+		if hypotheses.kept_weight < self.min_kept_weight:
+			# the cloud hasn't settled into a few hypotheses yet, don't throw most of it away
+			return self.core.kernels.resample(normalized(weights), random_sample(n)), None
+		indices = [np.zeros(0, dtype=np.intp)]
+		shares = [np.zeros(0)]
+		for cluster, budget in enumerate(hypotheses.budgets(n)):
+			members = np.flatnonzero(hypotheses.labels == cluster)
+			if budget == 0 or len(members) == 0:
+				continue
+			drawn = self.core.kernels.resample(normalized(weights[members]), random_sample(budget))
+			indices.append(members[drawn])
+			shares.append(np.full(budget, hypotheses.weights[cluster]/budget))
+		indices = np.concatenate(indices)
+		# scaled so that a particle weighs 1 on average, like the ones the other resamplers leave
+		shares = np.concatenate(shares)
+		return indices, shares*len(shares)/np.sum(shares) if len(shares) else shares
+
+def normalized(weights):
+	""" weights scaled to sum to 1 (uniform when they are all 0) """
+	weights = np.asarray(weights, dtype=np.float64)
+	total = np.sum(weights)
+	if not(total > 0):
+		return np.ones(len(weights))/len(weights)
+	return weights/total
+
+# pose estimators: estimate(x, y, theta, weights) returns the robot pose (x, y, theta), or None for an empty cloud
+
+@register('pose_estimator', 'top_fraction')
+class TopFractionPose(Engine):
+	""" The mode of the distribution (level 1): the average of the best particles
+		Attributes:
+			fraction: the share of the core's n_particles (the heaviest ones) that is averaged
+	"""
+
+	def __init__(self, core):
+		Engine.__init__(self, core)
+		self.fraction = 0.3
+
+	def estimate(self, x, y, theta, weights):
+		# Order by weights (highest first, ties in reverse order like sorting and reversing the cloud)
+		order = np.argsort(weights, kind='mergesort')[::-1]
+		top = order[:int(self.core.n_particles*self.fraction)]
+		if len(top) == 0:
+			return None
+		return se2.mean_pose(x[top], y[top], theta[top])
+
+@register('pose_estimator', 'weighted_mean')
+class WeightedMeanPose(Engine):
+	""" The mean of the distribution (level 2): the weighted average of the whole cloud """
+
+	def estimate(self, x, y, theta, weights):
+		if len(x) == 0:
+			return None
+		return se2.mean_pose(x, y, theta, normalized(weights))
+
+@register('pose_estimator', 'max_weight')
+class MaxWeightPose(Engine):
+	""" The single heaviest particle """
+
+	def estimate(self, x, y, theta, weights):
+		if len(x) == 0:
+			return None
+		best = int(np.argmax(weights))
+		return (float(x[best]), float(y[best]), float(theta[best]))
+
+@register('pose_estimator', 'dominant_cluster')
+class DominantClusterPose(TopFractionPose):
+	""" The mean pose of the heaviest hypothesis cluster, so that a cloud split across several places doesn't average
+		to a pose between them.  Falls back to the best particles when there are no clusters """
+
+	uses_clusters = True
+
+	def estimate(self, x, y, theta, weights):
+		hypotheses = self.core.cluster(x, y, theta, weights)
+		self.core.scheduler.metrics['clusters'] = len(hypotheses.weights)
+		pose = hypotheses.dominant_pose()
+		if pose != None:
+			return pose
+		return TopFractionPose.estimate(self, x, y, theta, weights)
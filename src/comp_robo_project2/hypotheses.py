@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+""" Groups the particle cloud into a small set of pose hypotheses.
+
+	In symmetric parts of a map the cloud splits across several modes, and averaging the whole cloud (or its best
+	particles) gives a pose somewhere between them, often inside a wall.  Clustering keeps the modes apart: the pose
+	estimate comes from the dominant cluster, each cluster gets a share of the particles in proportion to its weight
+	when the cloud is resampled, and clusters whose weight becomes negligible are dropped.
+"""
+
+import math
+
+import numpy as np
+
+from comp_robo_project2 import se2
+
+class HypothesisClusters:
+	""" Clusters particles by position and heading and keeps track of the resulting hypotheses.  The particles are
+		binned into a grid of cells over x, y and heading, every cell is linked to its heaviest neighbor, and each
+		chain of links ends at a local maximum of the weight that becomes a cluster, so a thin trail of light
+		particles doesn't join two modes into one
+		Attributes:
+			radius: the size (in meters) of the grid cells particles are binned into
+			angular_radius: the size (in radians) of the heading bins
+			merge_distance: clusters whose mean poses are closer than this (and within angular_radius) are merged
+			prune_weight: clusters with less than this fraction of the total weight are dropped
+			max_clusters: the most clusters that are kept (the lightest ones are dropped first)
+			min_particles: the smallest particle budget a kept cluster gets when the cloud is resampled
+			labels: the cluster of every particle in the last clustering (-1 for particles in dropped clusters)
+			poses: (k x 3) array of the weighted mean pose (x,y,theta) of each kept cluster, heaviest first
+			weights: the weight of each kept cluster (summing to 1)
+			kept_weight: the fraction of the total weight that is in the kept clusters
+	"""
+
+	def __init__(self, radius=0.5, angular_radius=math.pi/4, merge_distance=0.5, prune_weight=0.02, max_clusters=5,
+				 min_particles=10):
+		self.radius = radius
+		self.angular_radius = angular_radius
+		self.merge_distance = merge_distance
+		self.prune_weight = prune_weight
+		self.max_clusters = max_clusters
+		self.min_particles = min_particles
+		self.labels = np.empty(0, dtype=np.intp)
+		self.poses = np.empty((0, 3))
+		self.weights = np.empty(0)
+		self.kept_weight = 0.0
+
+	def update(self, x, y, theta, weights):
+		""" Cluster the particles (x, y, theta, weights) and update labels, poses and weights """
+		n = len(x)
+		weights = np.asarray(weights, dtype=np.float64)
+		total = np.sum(weights)
+		if n == 0 or not(total > 0):
+			weights = np.ones(n)
+			total = float(n)
+		if n == 0:
+			self.labels = np.empty(0, dtype=np.intp)
+			self.poses = np.empty((0, 3))
+			self.weights = np.empty(0)
+			self.kept_weight = 0.0
+			return
+
+		labels = self.grid_clusters(x, y, theta, weights)
+		k = labels.max() + 1
+		cluster_weights = np.bincount(labels, weights=weights, minlength=k)/total
+		poses = self.mean_poses(labels, k, x, y, theta, weights)
+
+		# merge the clusters heavy enough to be kept into heavier ones whose mean pose is close, heaviest first.
+		# (there are at most 1/prune_weight of them)
+		candidates = np.flatnonzero(cluster_weights >= self.prune_weight)
+		candidates = candidates[np.argsort(-cluster_weights[candidates], kind='mergesort')]
+		target = np.arange(k)
+		kept = []
+		for c in candidates:
+			for d in kept:
+				if (math.hypot(poses[c][0] - poses[d][0], poses[c][1] - poses[d][1]) < self.merge_distance and
+						math.fabs(se2.diff(poses[c][2], poses[d][2])) < self.angular_radius):
+					target[c] = d
+					break
+			else:
+				kept.append(c)
+		labels = target[labels]
+		cluster_weights = np.bincount(labels, weights=weights, minlength=k)/total
+		poses = self.mean_poses(labels, k, x, y, theta, weights)
+
+		# drop the lightest clusters past max_clusters.  When nothing is heavy enough the cloud has no hypotheses
+		# (the pose estimator and the resampler then treat it as a whole)
+		kept = np.array(kept, dtype=np.intp)
+		kept = kept[np.argsort(-cluster_weights[kept], kind='mergesort')][:self.max_clusters]
+		relabel = np.full(k, -1, dtype=np.intp)
+		relabel[kept] = np.arange(len(kept))
+		self.labels = relabel[labels]
+		self.poses = poses[kept]
+		self.kept_weight = float(np.sum(cluster_weights[kept]))
+		self.weights = cluster_weights[kept]/self.kept_weight if len(kept) else np.empty(0)
+
+	def grid_clusters(self, x, y, theta, weights):
+		""" Bin the particles into cells of radius x radius x angular_radius and label every particle with the local
+			maximum of the cell weights its cell climbs to.  Returns the labels, numbered from 0 """
+		n_headings = max(1, int(round(2*math.pi/self.angular_radius)))
+		cell_x = np.floor(x/self.radius).astype(np.int64)
+		cell_y = np.floor(y/self.radius).astype(np.int64)
+		cell_h = np.floor(se2.wrap_positive(theta)/(2*math.pi)*n_headings).astype(np.int64) % n_headings
+		# leave a row of empty cells on every side so neighbors never wrap around into other cells' keys
+		cell_x -= cell_x.min() - 1
+		cell_y -= cell_y.min() - 1
+		rows = cell_y.max() + 2
+		cells, cell_of = np.unique((cell_x*rows + cell_y)*n_headings + cell_h, return_inverse=True)
+		cell_weights = np.bincount(cell_of, weights=weights)
+		cells_h = cells % n_headings
+		cells_y = (cells//n_headings) % rows
+		cells_x = cells//(n_headings*rows)
+
+		# link every cell to its heaviest neighbor, itself included (ties go to the higher index, so every chain
+		# of links strictly climbs and ends at a cell that links to itself)
+		best = np.arange(len(cells))
+		for dx in (-1, 0, 1):
+			for dy in (-1, 0, 1):
+				for dh in (-1, 0, 1):
+					neighbors = ((cells_x + dx)*rows + cells_y + dy)*n_headings + (cells_h + dh) % n_headings
+					index = np.minimum(np.searchsorted(cells, neighbors), len(cells) - 1)
+					found = cells[index] == neighbors
+					better = found & ((cell_weights[index] > cell_weights[best]) |
+									  ((cell_weights[index] == cell_weights[best]) & (index > best)))
+					best = np.where(better, index, best)
+		# follow the links to the local maxima by pointer jumping
+		while True:
+			jumped = best[best]
+			if np.array_equal(jumped, best):
+				break
+			best = jumped
+		roots, labels = np.unique(best, return_inverse=True)
+		return labels[cell_of]
+
+	@staticmethod
+	def mean_poses(labels, k, x, y, theta, weights):
+		""" (k x 3) array of the weighted mean pose of the particles with each label (unweighted for labels whose
+			particles all have 0 weight) """
+		counts = np.bincount(labels, minlength=k).astype(np.float64)
+		totals = np.bincount(labels, weights=weights, minlength=k)
+		weights = np.where(totals[labels] > 0, weights, 1.0)
+		totals = np.where(totals > 0, totals, counts)
+		totals[totals == 0] = 1.0
+		mean_x = np.bincount(labels, weights=weights*x, minlength=k)/totals
+		mean_y = np.bincount(labels, weights=weights*y, minlength=k)/totals
+		mean_theta = np.arctan2(np.bincount(labels, weights=weights*np.sin(theta), minlength=k),
+								np.bincount(labels, weights=weights*np.cos(theta), minlength=k))
+		return np.column_stack((mean_x, mean_y, mean_theta))
+
+	def dominant_pose(self):
+		""" The mean pose (x, y, theta) of the heaviest cluster, or None if there are no clusters """
+		if len(self.poses) == 0:
+			return None
+		return tuple(self.poses[0])
+
+	def budgets(self, n):
+		""" Split n particles among the kept clusters in proportion to their weights, giving each at least
+			min_particles (when n allows).  Returns an array with the number of particles for each cluster """
+		k = len(self.weights)
+		if k == 0:
+			return np.zeros(0, dtype=np.intp)
+		floor = min(self.min_particles, n//k)
+		shares = (n - floor*k)*self.weights
+		budgets = floor + np.floor(shares).astype(np.intp)
+		# hand out what rounding left over to the largest remainders
+		remainder = n - np.sum(budgets)
+		budgets[np.argsort(np.floor(shares) - shares, kind='mergesort')[:remainder]] += 1
+		return budgets
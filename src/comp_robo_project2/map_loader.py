@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+""" Loads the maps in maps/ (a map_server style YAML file plus a PGM image) without going through map_server.
+
+	The raster is memory mapped and thresholded into occupancy values in a single vectorized pass, and the
+	result has the same layout as a nav_msgs/OccupancyGrid (row major, first row at the bottom of the image,
+	100 = occupied, 0 = free, -1 = unknown), except that data is a numpy array instead of a list.
+"""
+
+import os
+import re
+
+import numpy as np
+
+class MapPoint:
+	""" Stand-in for geometry_msgs/Point """
+	def __init__(self, x=0.0, y=0.0, z=0.0):
+		self.x = x
+		self.y = y
+		self.z = z
+
+class MapOrigin:
+	""" Stand-in for the geometry_msgs/Pose of a map's origin (only the position is used) """
+	def __init__(self, x=0.0, y=0.0, z=0.0):
+		self.position = MapPoint(x, y, z)
+
+class MapInfo:
+	""" Stand-in for nav_msgs/MapMetaData """
+	def __init__(self, resolution, width, height, origin):
+		self.resolution = resolution
+		self.width = width
+		self.height = height
+		self.origin = origin
+
+class LoadedMap:
+	""" A map read from disk with the same fields as a nav_msgs/OccupancyGrid
+		Attributes:
+			info: the MapInfo of the map
+			data: the occupancy values in row major order as a flat numpy int8 array
+			filename: the YAML file the map was read from
+	"""
+	def __init__(self, info, data, filename=None):
+		self.info = info
+		self.data = data
+		self.filename = filename
+
+def read_map_yaml(path):
+	""" Parse a map_server YAML file and return its fields as a dictionary (with the image path made absolute) """
+	import yaml
+	with open(path, 'r') as f:
+		try:
+			fields = yaml.safe_load(f)
+		except yaml.YAMLError as e:
+			raise ValueError('map file %s is not valid YAML: %s' % (path, e))
+	if not isinstance(fields, dict):
+		raise ValueError('map file %s does not describe a map' % path)
+	for name in ('image', 'resolution', 'origin'):
+		if name not in fields:
+			raise ValueError("map file %s is missing '%s'" % (path, name))
+	fields.setdefault('negate', 0)
+	fields.setdefault('occupied_thresh', 0.65)
+	fields.setdefault('free_thresh', 0.196)
+	if not os.path.isabs(fields['image']):
+		fields['image'] = os.path.join(os.path.dirname(os.path.abspath(path)), fields['image'])
+	return fields
+
+NETPBM_HEADER = re.compile(br'P([56])(?:\s|#[^\n]*\n)+(\d+)(?:\s|#[^\n]*\n)+(\d+)(?:\s|#[^\n]*\n)+(\d+)\s')
+
+def read_pgm(path):
+	""" Memory map a binary PGM (P5) image and return it as a (height x width) numpy array along with its max value.
+		Binary PPM (P6) images, which some map tools save with a .pgm extension, are mapped as (height x width x 3) """
+	with open(path, 'rb') as f:
+		header = f.read(1024)
+	match = NETPBM_HEADER.match(header)
+	if not match:
+		raise ValueError('%s is not a binary PGM (P5) or PPM (P6) image' % path)
+	width, height, max_value = int(match.group(2)), int(match.group(3)), int(match.group(4))
+	shape = (height, width) if match.group(1) == b'5' else (height, width, 3)
+	dtype = np.uint8 if max_value < 256 else np.dtype('>u2')
+	return np.memmap(path, dtype=dtype, mode='r', offset=match.end(), shape=shape), max_value
+
+def load_map(path):
+	""" Read the map described by the YAML file at path and return it as a LoadedMap """
+	fields = read_map_yaml(path)
+	image, max_value = read_pgm(fields['image'])
+	if image.ndim == 3:
+		# like map_server, color images are thresholded on the average of their channels
+		image = image.mean(axis=2)
+
+	# map_server treats a pixel as occupied if (max - value)/max > occupied_thresh (value/max when negated) and as
+	# free if it is below free_thresh.  Turning the thresholds into raw pixel values lets us compare the raster directly
+	occupied_value = max_value*(1.0 - fields['occupied_thresh'])
+	free_value = max_value*(1.0 - fields['free_thresh'])
+	if fields['negate']:
+		occupied = image > max_value*fields['occupied_thresh']
+		free = image < max_value*fields['free_thresh']
+	else:
+		occupied = image < occupied_value
+		free = image > free_value
+
+	# image rows run top to bottom but grid rows run bottom to top
+	grid = np.full(image.shape, -1, dtype=np.int8)
+	grid[occupied] = 100
+	grid[free] = 0
+	grid = np.ascontiguousarray(grid[::-1])
+
+	origin = fields['origin']
+	info = MapInfo(float(fields['resolution']), image.shape[1], image.shape[0], MapOrigin(float(origin[0]), float(origin[1])))
+	return LoadedMap(info, grid.ravel(), path)
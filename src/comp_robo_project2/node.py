@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+""" The ROS node around ParticleFilterCore: reads the map, listens for scans and initial pose estimates, looks up
+	the odometry in tf, and publishes the particle cloud, the pose estimate and the map to odom transform.
+
+	pf_level1.py and pf_level2.py run this node with their own defaults.  Every default can be overridden with a
+	private parameter of the same name:
+		~n_particles, ~d_thresh, ~a_thresh, ~laser_max_distance, ~laser_max_range, ~kernel_backend
+		~light_fraction: the fraction of d_thresh / a_thresh that triggers a weight-only update
+		~resample_threshold: resample only when the effective sample size falls below this fraction of the cloud
+		~motion_model, ~sensor_model, ~resampler, ~pose_estimator: the engines to use (see engines)
+		~clustered: shorthand for the clustered resampler and the dominant_cluster pose estimator
+		~map_file: read the map from this YAML file instead of asking map_server
+		~telemetry_path: record every update to this directory
+"""
+
+import time
+
+# tf, scipy / scikit-learn and numba are heavy, so they are only imported once (and if) they are needed
+import rospy
+
+from std_msgs.msg import Header, String, Float64MultiArray
+from sensor_msgs.msg import LaserScan
+from geometry_msgs.msg import PoseWithCovarianceStamped, PoseArray, Pose, Point, Quaternion
+
+import math
+
+from comp_robo_project2.core import ParticleFilterCore, DEFAULT_ENGINES
+from comp_robo_project2.occupancy_field import OccupancyField
+from comp_robo_project2.update_scheduler import UpdateScheduler
+from comp_robo_project2.startup import StartupProfile, MapFetcher, OccupancyFieldCache
+from comp_robo_project2.map_loader import load_map
+from comp_robo_project2.transform_cache import TransformCache, to_translation_rotation, yaw_from_quaternion, quaternion_from_yaw
+from comp_robo_project2.telemetry import TelemetryRecorder
+
+# the level 1 filter's parameters, the node's defaults for anything the launcher doesn't set
+DEFAULTS = dict(DEFAULT_ENGINES, n_particles=200, d_thresh=0.1, a_thresh=math.pi/12, laser_max_distance=2.0,
+				laser_max_range=6.0, kernel_backend='auto', light_fraction=0.5, resample_threshold=0.1, clustered=False)
+
+class TransformHelpers:
+	""" Some convenience functions for translating between various representions of a robot pose.
+		TODO: nothing... you should not have to modify these """
+
+	@staticmethod
+	def convert_xy_and_theta_to_pose(xy_theta):
+		""" Convert a (x,y,yaw) tuple to a geometry_msgs/Pose message """
+		orientation_tuple = quaternion_from_yaw(xy_theta[2])
+		return Pose(position=Point(x=xy_theta[0],y=xy_theta[1],z=0), orientation=Quaternion(x=orientation_tuple[0], y=orientation_tuple[1], z=orientation_tuple[2], w=orientation_tuple[3]))
+
+	@staticmethod
+	def convert_pose_to_xy_and_theta(pose):
+		""" Convert pose (geometry_msgs.Pose) to a (x,y,yaw) tuple """
+		orientation_tuple = (pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w)
+		return (pose.position.x, pose.position.y, yaw_from_quaternion(orientation_tuple))
+
+class ParticleFilter:
+	""" The class that represents a Particle Filter ROS Node
+		Attributes list:
+			initialized: a Boolean flag to communicate to other class methods that initializaiton is complete
+			base_frame: the name of the robot base coordinate frame (should be "base_link" for most robots)
+			map_frame: the name of the map coordinate frame (should be "map" in most cases)
+			odom_frame: the name of the odometry coordinate frame (should be "odom" in most cases)
+			scan_topic: the name of the scan topic to listen to (should be "scan" in most cases)
+			pf: the ParticleFilterCore doing the actual filtering
+			pose_listener: a subscriber that listens for new approximate pose estimates (i.e. generated through the rviz GUI)
+			particle_pub: a publisher for the particle cloud
+			pose_pub: a publisher for the estimated pose
+			metrics_pub: publishes the scheduler's decision metrics after every update
+			hypotheses_pub: publishes the mean pose of every hypothesis cluster, heaviest first (when an engine clusters)
+			hypothesis_weights_pub: publishes the weight of every hypothesis cluster, in the same order
+			laser_subscriber: listens for new scan data on topic self.scan_topic
+			tf_listener: listener for coordinate transforms
+			tf_broadcaster: broadcaster for coordinate transforms
+			transforms: caches static transforms and does the per-scan tf lookups (see transform_cache)
+			laser_pose: the pose of the laser in the base frame as an (x,y,theta) numpy array
+			last_scan: the most recent scan (sensor_msgs/LaserScan), used to seed the cloud when a new pose estimate arrives
+			map_file: the map_server style YAML file to read the map from directly (~map_file parameter).  When it is
+					  empty or can't be read the map is requested from map_server's static_map service instead
+			startup_profile: how long each phase of startup took, printed after the first full update
+			field_cache: on-disk cache of occupancy field distances so they are only computed once per map
+			telemetry_path: directory to record every update to (~telemetry_path parameter, nothing is recorded when empty)
+	"""
+
+	def __init__(self, node_name='comp_robo_project2', import_start=None, **defaults):
+		""" node_name: the name to register the node as
+			import_start: when the script started loading (time.time()), for the startup profile
+			defaults: overrides of DEFAULTS for this node, the parameter server has the last word """
+		print "ParticleFilter initializing "
+		self.initialized = False		# make sure we don't perform updates before everything is setup
+		self.startup_profile = StartupProfile(import_start)
+		if import_start != None:
+			self.startup_profile.add('import', time.time() - import_start)
+		rospy.init_node(node_name)
+
+		# read the map straight from disk when we know where it is, otherwise request it from map_server right
+		# away so that it arrives while the rest of the node is set up
+		self.map_file = rospy.get_param('~map_file', '')
+		worldMap = None
+		map_fetcher = None
+		if self.map_file:
+			self.startup_profile.begin()
+			try:
+				worldMap = load_map(self.map_file)
+			except (IOError, OSError, ValueError, ImportError) as e:
+				print "couldn't read " + self.map_file + " (" + str(e) + "), falling back to map server"
+			self.startup_profile.end('map load')
+		if worldMap == None:
+			print "waiting for map server"
+			map_fetcher = MapFetcher('static_map')
+			map_fetcher.start()
+		# the distances for the map we used last time are probably the ones we need again
+		self.startup_profile.begin()
+		self.field_cache = OccupancyFieldCache()
+		self.field_cache.prefetch()
+		self.startup_profile.end('cache prefetch')
+
+		self.base_frame = "base_link"		# the frame of the robot base
+		self.map_frame = "map"			# the name of the map coordinate frame
+		self.odom_frame = "odom"		# the name of the odometry coordinate frame
+		self.scan_topic = "scan"		# the topic where we will get laser scans from
+		self.last_scan = None
+
+		params = dict(DEFAULTS)
+		params.update(defaults)
+		for name in params:
+			params[name] = rospy.get_param('~' + name, params[name])
+		engines = dict((kind, params.pop(kind)) for kind in DEFAULT_ENGINES)
+		if params.pop('clustered'):
+			# track several pose hypotheses instead of averaging the whole cloud
+			engines.update(resampler='clustered', pose_estimator='dominant_cluster')
+
+		self.startup_profile.begin()
+		self.pf = ParticleFilterCore(engines=engines, **params)
+		self.startup_profile.end('kernels')
+		print "using " + self.pf.kernels.name + " kernels, engines: " + ", ".join(
+			kind + "=" + self.pf.engine_names[kind] for kind in sorted(engines))
+
+		# recording is opt in, the recorder writes on its own thread so the filter only pays for copying the arrays
+		self.telemetry_path = rospy.get_param('~telemetry_path', '')
+		if self.telemetry_path:
+			self.pf.telemetry = TelemetryRecorder(self.telemetry_path)
+			rospy.on_shutdown(self.pf.telemetry.close)
+
+		# Setup pubs and subs
+
+		# pose_listener responds to selection of a new approximate robot location (for instance using rviz)
+		self.pose_listener = rospy.Subscriber("initialpose", PoseWithCovarianceStamped, self.update_initial_pose)
+		# publish the current particle cloud.  This enables viewing particles in rviz.
+		self.particle_pub = rospy.Publisher("particlecloud", PoseArray)
+		self.pose_pub = rospy.Publisher("predictedPose", PoseArray)
+		self.metrics_pub = rospy.Publisher("pf_metrics", String)
+		self.hypotheses_pub = rospy.Publisher("hypotheses", PoseArray)
+		self.hypothesis_weights_pub = rospy.Publisher("hypothesis_weights", Float64MultiArray)
+
+		# laser_subscriber listens for data from the lidar
+		self.laser_subscriber = rospy.Subscriber(self.scan_topic, LaserScan, self.scan_received)
+
+		# enable listening for and broadcasting coordinate transforms
+		self.startup_profile.begin()
+		from tf import TransformListener, TransformBroadcaster
+		self.tf_listener = TransformListener()
+		self.tf_broadcaster = TransformBroadcaster()
+		self.transforms = TransformCache(self.tf_listener, self.base_frame, self.odom_frame)
+		self.startup_profile.end('tf')
+
+		if map_fetcher != None:
+			self.startup_profile.begin()
+			worldMap = map_fetcher.wait()
+			self.startup_profile.end('map wait')
+			self.startup_profile.add('map fetch', map_fetcher.elapsed)
+
+		if worldMap:
+			print "obtained map"
+
+		self.startup_profile.begin()
+		occupancy_field = OccupancyField(worldMap, self.field_cache)
+		self.startup_profile.end('field build')
+		self.startup_profile.begin()
+		self.pf.set_map(occupancy_field)
+		self.startup_profile.end('scan matcher')
+		self.initialized = True
+		print "ParticleFilter initialized"
+
+	def update_initial_pose(self, msg):
+		""" Callback function to handle re-initializing the particle filter based on a pose estimate.
+			These pose estimates could be generated by another ROS Node or could come from the rviz GUI """
+		xy_theta = TransformHelpers.convert_pose_to_xy_and_theta(msg.pose.pose)
+		print "initializing particle cloud around the given pose"
+		self.pf.initialize(xy_theta, self.last_scan.ranges if self.last_scan != None else None)
+		self.fix_map_to_odom_transform()
+
+	def publish_predicted_pose(self):
+		# actually send the message so that we can view it in rviz
+		if self.pf.robot_xy_theta == None:
+			return
+		pose = TransformHelpers.convert_xy_and_theta_to_pose(self.pf.robot_xy_theta)
+		self.pose_pub.publish(PoseArray(header=Header(stamp=rospy.Time.now(),frame_id=self.map_frame),poses=[pose]))
+
+	def publish_particles(self):
+		particles_conv = [TransformHelpers.convert_xy_and_theta_to_pose(xy_theta)
+						  for xy_theta in zip(self.pf.x, self.pf.y, self.pf.theta)]
+		# actually send the message so that we can view it in rviz
+		self.particle_pub.publish(PoseArray(header=Header(stamp=rospy.Time.now(),frame_id=self.map_frame),poses=particles_conv))
+
+	def publish_hypotheses(self, hypotheses):
+		""" Publish the mean pose and the weight of every hypothesis cluster (heaviest first) """
+		poses = [TransformHelpers.convert_xy_and_theta_to_pose(pose) for pose in hypotheses.poses]
+		self.hypotheses_pub.publish(PoseArray(header=Header(stamp=rospy.Time.now(),frame_id=self.map_frame),poses=poses))
+		self.hypothesis_weights_pub.publish(Float64MultiArray(data=[float(w) for w in hypotheses.weights]))
+
+	def scan_received(self, msg):
+		""" This is the default logic for what to do when processing scan data.  Feel free to modify this, however,
+			I hope it will provide a good guide.  The input msg is an object of type sensor_msgs/LaserScan """
+		if not(self.initialized):
+			# wait for initialization to complete
+			print "not initialized"
+			return
+
+		self.last_scan = msg
+
+		# calculate pose of laser relative ot the robot base.  The laser is bolted on, so after the first
+		# scan this doesn't touch tf at all
+		self.laser_pose = self.transforms.static_pose(msg.header.frame_id)
+		if self.laser_pose is None:
+			# need to know how to transform the laser to the base frame
+			# this will be given by either Gazebo or neato_node
+			return
+
+		# find out where the robot thinks it is based on its odometry (a single lookup at the scan's timestamp)
+		odom_pose = self.transforms.odom_pose(msg.header.stamp)
+		if odom_pose is None:
+			# need to know how to transform between base and odometric frames
+			# this will eventually be published by either Gazebo or neato_node
+			return
+		# store the the odometry pose in a more convenient format (x,y,theta)
+		self.process_scan(msg, tuple(odom_pose))
+
+	def process_scan(self, msg, new_odom_xy_theta):
+		""" Run the filter on the scan msg, taken when the robot was at new_odom_xy_theta in the odometry frame, and
+			publish the results.  Returns the scheduler's decision for the scan """
+		first_scan = not self.pf.has_cloud()
+		update_start = time.time()
+		decision = self.pf.process_scan(msg.ranges, new_odom_xy_theta)
+		if first_scan or decision == UpdateScheduler.FULL:
+			# update map to odom transform now that we have new particles
+			self.fix_map_to_odom_transform()
+		if decision == UpdateScheduler.FULL:
+			self.publish_particles()
+			hypotheses = self.pf.hypotheses()
+			if hypotheses != None:
+				self.publish_hypotheses(hypotheses)
+		if decision != UpdateScheduler.SKIP:
+			self.metrics_pub.publish(String(data=self.pf.scheduler.format_metrics()))
+		if decision == UpdateScheduler.FULL and not(self.startup_profile.finished):
+			self.startup_profile.finish(time.time() - update_start)
+			print self.startup_profile.report()
+
+		# publish particles (so things like rviz can see them)
+		self.publish_predicted_pose()
+		return decision
+
+	def fix_map_to_odom_transform(self):
+		""" Update the map to odom transform so that the robot's odometry pose at the time of the latest scan lands on
+			its estimated pose in the map.  map->odom = (map->base)*(odom->base)^-1, computed on SE(2) arrays """
+		if self.pf.odom_xy_theta == None or self.pf.robot_xy_theta == None:
+			# no odometry yet, the transform gets fixed on the first scan
+			return
+		self.odom_to_map = TransformCache.map_to_odom(self.pf.robot_xy_theta, self.pf.odom_xy_theta)
+		(self.translation, self.rotation) = to_translation_rotation(self.odom_to_map)
+
+	def broadcast_last_transform(self):
+		""" Make sure that we are always broadcasting the last map to odom transformation.
+			This is necessary so things like move_base can work properly. """
+		if not(hasattr(self,'translation') and hasattr(self,'rotation')):
+			return
+		self.tf_broadcaster.sendTransform(self.translation, self.rotation, rospy.get_rostime(), self.odom_frame, self.map_frame)
+
+def main(node_name='comp_robo_project2', import_start=None, **defaults):
+	""" Run the particle filter node until ROS shuts down """
+	print "starting"
+	n = ParticleFilter(node_name, import_start, **defaults)
+	r = rospy.Rate(5)
+
+	while not(rospy.is_shutdown()):
+		# in the main loop all we do is continuously broadcast the latest map to odom transform
+		n.broadcast_last_transform()
+		r.sleep()
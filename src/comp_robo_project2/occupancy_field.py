@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+""" The occupancy field (likelihood field) of a map: the distance from every cell to the closest obstacle, along
+	with the free and occupied cells the filter samples particles from and casts rays through. """
+
+import numpy as np
+
+class OccupancyField:
+	""" Stores an occupancy field for an input map.  An occupancy field returns the distance to the closest
+		obstacle for any coordinate in the map
+		Attributes:
+			map: the map to localize against. Known unoccupied cells are white, obstacles are white, and unknown is grey
+				 (nav_msgs/OccupancyGrid, or a map_loader.LoadedMap)
+			closest_occ: the distance for each entry in the OccupancyGrid to the closest obstacle (a flat numpy array)
+			distance_grid: closest_occ as a numpy array indexed by [row, column] (i.e. [y, x])
+			free_grid: a boolean numpy array indexed by [row, column] that is True for known unoccupied cells
+			free_cells: an (n x 2) numpy array of the (x,y) indices of every known unoccupied cell
+			occupied_grid: a boolean numpy array indexed by [row, column] that is True for obstacles
+	"""
+
+	def __init__(self, map, cache=None):
+		""" map: the nav_msgs/OccupancyGrid to build the field for
+			cache: an OccupancyFieldCache to load the distances from (or save them to) instead of recomputing them """
+		self.map = map		# save this for later
+		self.resolution = self.map.info.resolution
+		self.origin = self.map.info.origin #to get ge the x coordinate of the origin write self.origin.position.x
+
+		# occupancy grids are stored in row major order, so the data reshapes straight into a (height x width) grid
+		grid = np.asarray(self.map.data, dtype=np.int8).reshape((self.map.info.height, self.map.info.width))
+		self.free_grid = grid == 0
+		self.occupied_grid = grid > 0
+		# index of the cells that are not inhabited by an obstacle (unoccupied cells are white)
+		self.free_cells = np.argwhere(self.free_grid)[:,::-1]
+
+		key = None
+		self.distance_grid = None
+		if cache != None:
+			key = cache.key(self.map.info, grid)
+			self.distance_grid = cache.load(key)
+		if self.distance_grid is None:
+			self.distance_grid = (self.compute_distance_grid(self.occupied_grid)*self.resolution).astype(np.float32)
+			if cache != None:
+				cache.store(key, self.distance_grid)
+
+		# flat view of the distances that is indexed the same way as the OccupancyGrid data
+		self.closest_occ = self.distance_grid.ravel()
+
+	@staticmethod
+	def compute_distance_grid(occupied_grid):
+		""" Returns the distance (in cells) from every cell to the closest occupied cell.  Uses scipy's exact euclidean
+			distance transform when scipy is available and falls back to scikit learn's nearest neighbor search """
+		try:
+			from scipy.ndimage import distance_transform_edt
+		except ImportError:
+			from sklearn.neighbors import NearestNeighbors
+			cells = np.indices(occupied_grid.shape).reshape((2, -1)).T
+			nbrs = NearestNeighbors(n_neighbors=1,algorithm="ball_tree").fit(np.argwhere(occupied_grid))
+			distances, indices = nbrs.kneighbors(cells)
+			return distances[:,0].reshape(occupied_grid.shape)
+		return distance_transform_edt(~occupied_grid)
+
+	def get_closest_obstacle_distance(self,x,y):
+		""" (x,y) is in meters. Compute the closest obstacle to the specified (x,y) coordinate in the map.  If the (x,y) coordinate
+			is out of the map boundaries, nan will be returned. """
+		x_coord = int((x - self.map.info.origin.position.x)/self.map.info.resolution)
+		y_coord = int((y - self.map.info.origin.position.y)/self.map.info.resolution)
+
+		# check if we are in bounds
+		if x_coord >= self.map.info.width or x_coord < 0:
+			return float('nan')
+		if y_coord >= self.map.info.height or y_coord < 0:
+			return float('nan')
+
+		ind = x_coord + y_coord*self.map.info.width
+		if ind >= self.map.info.width*self.map.info.height or ind < 0:
+			return float('nan')
+		return self.closest_occ[ind]
+
+	def origin_xy(self):
+		""" The (x,y) of the map origin, the way the kernels take it """
+		return (self.origin.position.x, self.origin.position.y)
+
+	def bounds(self):
+		""" The (min x, max x, min y, max y) particles are kept within (assumes the map is centered at 0,0) """
+		return (self.origin.position.x, -self.origin.position.x, self.origin.position.y, -self.origin.position.y)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+""" Array kernels for the hot loops of the particle filter (motion model, likelihood field sensor model,
+	resampling and ray casting).
+
+	Every backend exposes the same static methods on arrays of particle poses.  The pure numpy backend is always
+	available; the compiled numba backend (pf_kernels_numba) is only imported the first time it is asked for and
+	get_backend falls back to numpy when numba is not installed.
+
+	Run this module (python -m comp_robo_project2.pf_kernels) to check that the compiled backend agrees with the
+	numpy one.  It exits with status 1 when a kernel differs by more than its PARITY_TOLERANCES entry.
+"""
+
+import math
+import sys
+
+import numpy as np
+
+from comp_robo_project2 import se2
+
+# upper bound on the number of (particle, beam) pairs the numpy backend materializes at once
+CHUNK_ELEMENTS = 1 << 18
+
+# smallest mean cubed error the sensor model divides by (a perfect fit would otherwise give an infinite weight)
+MIN_ERROR = 1e-9
+
+# the largest difference from the numpy kernels check_parity accepts for each kernel: motion in meters and radians,
+# score relative to the numpy score, resample in particle indices and calc_range in meters.  The backends do the
+# same arithmetic, so anything past rounding error is a bug
+PARITY_TOLERANCES = {'motion': 1e-9, 'score': 1e-9, 'resample': 0, 'calc_range': 1e-9}
+
+class NumpyKernels:
+	""" Vectorized numpy implementation of the filter kernels.  Temporaries are built in chunks of particles
+		so that memory stays bounded no matter how many particles and beams are used """
+
+	name = 'numpy'
+
+	@staticmethod
+	def motion(x, y, theta, delta, old_theta, bounds):
+		""" Move the particles (in place) by the odometry change delta=(dx,dy,dtheta), which is expressed in
+			the odometry frame where the robot had heading old_theta.  Headings are wrapped to [0,2*pi) and
+			positions are clamped to bounds=(x_min,x_max,y_min,y_max) """
+		angle = theta - old_theta
+		cos_angle = np.cos(angle)
+		sin_angle = np.sin(angle)
+		x += delta[0]*cos_angle - delta[1]*sin_angle
+		y += delta[0]*sin_angle + delta[1]*cos_angle
+		theta += delta[2]
+		se2.wrap_positive(theta, out=theta)
+		np.clip(x, bounds[0], bounds[1], out=x)
+		np.clip(y, bounds[2], bounds[3], out=y)
+
+	@staticmethod
+	def score(x, y, theta, angles, ranges, distance_grid, origin, resolution, max_distance):
+		""" Likelihood field sensor model. Returns for each particle 1/mean(d^3) where d is the distance from each
+			beam endpoint to the closest obstacle, capped at max_distance (endpoints off the map get max_distance) """
+		n = len(x)
+		m = len(angles)
+		likelihoods = np.ones(n)
+		if m == 0:
+			return likelihoods
+		height, width = distance_grid.shape
+		chunk = max(1, CHUNK_ELEMENTS//m)
+		for start in range(0, n, chunk):
+			stop = min(start + chunk, n)
+			heading = theta[start:stop, np.newaxis] + angles[np.newaxis, :]
+			cx = np.floor((x[start:stop, np.newaxis] + ranges*np.cos(heading) - origin[0])/resolution).astype(np.intp)
+			cy = np.floor((y[start:stop, np.newaxis] + ranges*np.sin(heading) - origin[1])/resolution).astype(np.intp)
+			inside = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+			dist = np.where(inside, distance_grid[np.clip(cy, 0, height - 1), np.clip(cx, 0, width - 1)], max_distance)
+			np.minimum(dist, max_distance, out=dist)
+			likelihoods[start:stop] = 1.0/np.maximum(np.mean(dist**3, axis=1), MIN_ERROR)
+		return likelihoods
+
+	@staticmethod
+	def resample(weights, draws):
+		""" Multinomial resampling. Returns the index of the particle selected by each uniform draw in [0,1),
+			where weights are the normalized particle weights """
+		bins = np.add.accumulate(weights)
+		return np.minimum(np.searchsorted(bins, draws, side='right'), len(weights) - 1)
+
+	@staticmethod
+	def calc_range(x, y, theta, occupied_grid, origin, resolution, max_range):
+		""" Ray cast from each pose (x,y,theta) and return the distance to the first occupied cell.  Rays that
+			leave the map or travel max_range without hitting anything return max_range """
+		n = len(x)
+		ranges = np.empty(n)
+		height, width = occupied_grid.shape
+		steps = resolution*np.arange(1, int(math.ceil(max_range/resolution)) + 1)
+		chunk = max(1, CHUNK_ELEMENTS//len(steps))
+		for start in range(0, n, chunk):
+			stop = min(start + chunk, n)
+			cx = np.floor((x[start:stop, np.newaxis] + steps*np.cos(theta[start:stop, np.newaxis]) - origin[0])/resolution).astype(np.intp)
+			cy = np.floor((y[start:stop, np.newaxis] + steps*np.sin(theta[start:stop, np.newaxis]) - origin[1])/resolution).astype(np.intp)
+			inside = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+			hit = inside & occupied_grid[np.clip(cy, 0, height - 1), np.clip(cx, 0, width - 1)]
+			# a ray also stops where it first leaves the map
+			stopped = hit | ~inside
+			first = np.argmax(stopped, axis=1)
+			found = stopped[np.arange(stop - start), first]
+			ranges[start:stop] = np.where(found & hit[np.arange(stop - start), first], steps[first], max_range)
+		return np.minimum(ranges, max_range)
+
+_backends = {'numpy': NumpyKernels}
+
+def get_backend(name='auto'):
+	""" Return the kernel backend called name ('numpy', 'numba' or 'auto').  The compiled backend is imported
+		on first use; 'auto' and 'numba' fall back to numpy when it can't be loaded """
+	if name in _backends:
+		return _backends[name]
+	if name not in ('auto', 'numba'):
+		raise ValueError("unknown kernel backend '%s'" % name)
+	try:
+		from comp_robo_project2.pf_kernels_numba import NumbaKernels
+	except ImportError:
+		_backends['numba'] = NumpyKernels
+	else:
+		_backends['numba'] = NumbaKernels
+	_backends['auto'] = _backends['numba']
+	return _backends[name]
+
+def warm_up(kernels):
+	""" Run every kernel once on tiny inputs so that compiled backends are built before the first filter update """
+	poses = [np.zeros(2), np.zeros(2), np.zeros(2)]
+	grid = np.zeros((4, 4), dtype=np.float32)
+	kernels.motion(poses[0], poses[1], poses[2], (0.1, 0.0, 0.1), 0.0, (-1.0, 1.0, -1.0, 1.0))
+	kernels.score(poses[0], poses[1], poses[2], np.zeros(2), np.ones(2), grid, (0.0, 0.0), 0.05, 2.0)
+	kernels.resample(np.array([0.5, 0.5]), np.array([0.25, 0.75]))
+	kernels.calc_range(poses[0], poses[1], poses[2], grid > 0, (0.0, 0.0), 0.05, 1.0)
+
+def check_parity(backend, reference=NumpyKernels, n_particles=2000, n_beams=90, seed=0):
+	""" Run backend and reference on the same random inputs and return the largest absolute difference
+		for each kernel (as a dict) """
+	rng = np.random.RandomState(seed)
+	height, width, resolution, origin = 120, 160, 0.05, (-4.0, -3.0)
+	occupied_grid = rng.random_sample((height, width)) < 0.02
+	occupied_grid[0,:] = occupied_grid[-1,:] = occupied_grid[:,0] = occupied_grid[:,-1] = True
+	distance_grid = rng.random_sample((height, width))*2.0
+	x = rng.uniform(origin[0], origin[0] + width*resolution, n_particles)
+	y = rng.uniform(origin[1], origin[1] + height*resolution, n_particles)
+	theta = rng.uniform(0, 2*math.pi, n_particles)
+	angles = np.linspace(0, 2*math.pi, n_beams, endpoint=False)
+	ranges = rng.uniform(0.2, 6.0, n_beams)
+	bounds = (origin[0], -origin[0], origin[1], -origin[1])
+
+	errors = {}
+	poses = [(x.copy(), y.copy(), theta.copy()) for kernels in (backend, reference)]
+	for kernels, pose in zip((backend, reference), poses):
+		kernels.motion(pose[0], pose[1], pose[2], (0.12, -0.05, 0.3), 0.7, bounds)
+	errors['motion'] = max(np.max(np.abs(a - b)) for a, b in zip(poses[0], poses[1]))
+
+	scores = [kernels.score(x, y, theta, angles, ranges, distance_grid, origin, resolution, 2.0) for kernels in (backend, reference)]
+	errors['score'] = np.max(np.abs(scores[0] - scores[1])/scores[1])
+
+	weights = rng.random_sample(n_particles)
+	weights /= np.sum(weights)
+	draws = rng.random_sample(n_particles)
+	errors['resample'] = np.max(np.abs(backend.resample(weights, draws) - reference.resample(weights, draws)))
+
+	casts = [kernels.calc_range(x, y, theta, occupied_grid, origin, resolution, 6.0) for kernels in (backend, reference)]
+	errors['calc_range'] = np.max(np.abs(casts[0] - casts[1]))
+	return errors
+
+if __name__ == '__main__':
+	backend = get_backend('numba')
+	if backend is NumpyKernels:
+		print "numba is not available, nothing to compare"
+		sys.exit(0)
+	failed = []
+	for kernel, error in sorted(check_parity(backend).items()):
+		ok = error <= PARITY_TOLERANCES[kernel]
+		print "%-10s max difference %g (tolerance %g) %s" % (kernel, error, PARITY_TOLERANCES[kernel], 'ok' if ok else 'FAILED')
+		if not ok:
+			failed.append(kernel)
+	if failed:
+		print "%s backend disagrees with numpy: %s" % (backend.name, ', '.join(failed))
+		sys.exit(1)
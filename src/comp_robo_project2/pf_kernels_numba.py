@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+""" Compiled (numba) versions of the particle filter kernels in pf_kernels.
+
+	The loops are fused per particle (or per ray), so the sensor model never allocates the particles x beams
+	matrix of endpoints and ray casting stops at the first occupied cell.  Importing this module requires numba.
+"""
+
+import math
+
+import numba
+import numpy as np
+
+from comp_robo_project2.pf_kernels import MIN_ERROR
+
+@numba.njit(cache=True)
+def _motion(x, y, theta, dx, dy, dtheta, old_theta, x_min, x_max, y_min, y_max):
+	two_pi = 2*math.pi
+	for i in range(x.shape[0]):
+		angle = theta[i] - old_theta
+		cos_angle = math.cos(angle)
+		sin_angle = math.sin(angle)
+		x[i] = min(max(x[i] + dx*cos_angle - dy*sin_angle, x_min), x_max)
+		y[i] = min(max(y[i] + dx*sin_angle + dy*cos_angle, y_min), y_max)
+		theta[i] = (theta[i] + dtheta) % two_pi
+
+@numba.njit(cache=True)
+def _score(x, y, theta, angles, ranges, distance_grid, origin_x, origin_y, resolution, max_distance, likelihoods):
+	height, width = distance_grid.shape
+	m = angles.shape[0]
+	for i in range(x.shape[0]):
+		error = 0.0
+		for j in range(m):
+			heading = theta[i] + angles[j]
+			cx = int(math.floor((x[i] + ranges[j]*math.cos(heading) - origin_x)/resolution))
+			cy = int(math.floor((y[i] + ranges[j]*math.sin(heading) - origin_y)/resolution))
+			dist = max_distance
+			if cx >= 0 and cx < width and cy >= 0 and cy < height:
+				dist = min(distance_grid[cy, cx], max_distance)
+			error += dist*dist*dist
+		likelihoods[i] = 1.0/max(error/m, MIN_ERROR)
+
+@numba.njit(cache=True)
+def _resample(bins, draws, indices):
+	last = bins.shape[0] - 1
+	for i in range(draws.shape[0]):
+		# binary search for the first bin edge greater than the draw
+		lo = 0
+		hi = bins.shape[0]
+		while lo < hi:
+			mid = (lo + hi)//2
+			if bins[mid] <= draws[i]:
+				lo = mid + 1
+			else:
+				hi = mid
+		indices[i] = min(lo, last)
+
+@numba.njit(cache=True)
+def _calc_range(x, y, theta, occupied_grid, origin_x, origin_y, resolution, max_range, n_steps, ranges):
+	height, width = occupied_grid.shape
+	for i in range(x.shape[0]):
+		ranges[i] = max_range
+		cos_theta = math.cos(theta[i])
+		sin_theta = math.sin(theta[i])
+		for k in range(1, n_steps + 1):
+			step = resolution*k
+			cx = int(math.floor((x[i] + step*cos_theta - origin_x)/resolution))
+			cy = int(math.floor((y[i] + step*sin_theta - origin_y)/resolution))
+			if cx < 0 or cx >= width or cy < 0 or cy >= height:
+				break
+			if occupied_grid[cy, cx]:
+				ranges[i] = min(step, max_range)
+				break
+
+class NumbaKernels:
+	""" numba implementation of the kernels, see pf_kernels.NumpyKernels for the meaning of the arguments """
+
+	name = 'numba'
+
+	@staticmethod
+	def motion(x, y, theta, delta, old_theta, bounds):
+		_motion(x, y, theta, float(delta[0]), float(delta[1]), float(delta[2]), float(old_theta),
+				float(bounds[0]), float(bounds[1]), float(bounds[2]), float(bounds[3]))
+
+	@staticmethod
+	def score(x, y, theta, angles, ranges, distance_grid, origin, resolution, max_distance):
+		likelihoods = np.ones(len(x))
+		if len(angles) == 0:
+			return likelihoods
+		_score(x, y, theta, np.ascontiguousarray(angles, dtype=np.float64), np.ascontiguousarray(ranges, dtype=np.float64),
+			   distance_grid, float(origin[0]), float(origin[1]), float(resolution), float(max_distance), likelihoods)
+		return likelihoods
+
+	@staticmethod
+	def resample(weights, draws):
+		indices = np.empty(len(draws), dtype=np.intp)
+		_resample(np.add.accumulate(weights), np.asarray(draws, dtype=np.float64), indices)
+		return indices
+
+	@staticmethod
+	def calc_range(x, y, theta, occupied_grid, origin, resolution, max_range):
+		ranges = np.empty(len(x))
+		n_steps = int(math.ceil(max_range/resolution))
+		_calc_range(x, y, theta, occupied_grid, float(origin[0]), float(origin[1]), float(resolution),
+					float(max_range), n_steps, ranges)
+		return ranges
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+""" Branch-and-bound correlative scan matching against an OccupancyField.
+
+	The search over x, y and theta is exhaustive, but whole blocks of translations are ruled
+	out at once by scoring them against max-pooled copies of a likelihood grid.  The score of
+	a block on a pooled grid is an upper bound on the score of every pose inside it, so a best
+	first search that only expands the most promising blocks returns the same top candidates
+	as brute force (Olson, "Real-Time Correlative Scan Matching", 2009).
+
+	A search over a whole large map still takes seconds, so CandidateSearch runs them in the
+	background and keeps the latest candidates moving along with the odometry.
+"""
+
+import heapq
+import math
+import threading
+import time
+
+import numpy as np
+
+from comp_robo_project2 import se2
+
+class CorrelativeScanMatcher:
+	""" Finds the poses in the map that best explain a laser scan
+		Attributes:
+			resolution: the size of a grid cell in meters
+			origin_x: the x-coordinate of the lower left corner of the map
+			origin_y: the y-coordinate of the lower left corner of the map
+			width: the number of columns in the map
+			height: the number of rows in the map
+			n_levels: the number of grids in the pyramid, level k is max-pooled over a 2^k x 2^k window
+			angular_step: the spacing (in radians) of the headings that are searched
+			n_beams: the number of beams a scan is subsampled to before matching
+			free_grid: boolean grid that is True for known unoccupied cells (robot poses must be in one)
+			margin: the number of empty cells the pooled grids are padded with below and to the left of the map
+			pooled: the pyramid of max-pooled likelihood grids, pooled[0] is the likelihood grid itself
+	"""
+
+	def __init__(self, occupancy_field, sigma=0.1, n_levels=6, angular_step=math.pi/64, n_beams=60):
+		""" Precompute the likelihood grid and its max-pooled pyramid
+			occupancy_field: the OccupancyField to match against
+			sigma: standard deviation (in meters) of the gaussian applied to the distance to the closest obstacle
+			n_levels: the number of grids in the pyramid
+			angular_step: the spacing (in radians) of the headings that are searched
+			n_beams: the number of beams a scan is subsampled to before matching """
+		self.resolution = occupancy_field.resolution
+		self.origin_x = occupancy_field.origin.position.x
+		self.origin_y = occupancy_field.origin.position.y
+		self.n_levels = n_levels
+		self.angular_step = angular_step
+		self.n_beams = n_beams
+
+		likelihood = np.exp(-0.5*(occupancy_field.distance_grid/sigma)**2)
+		self.height, self.width = likelihood.shape
+		self.free_grid = occupancy_field.free_grid
+		# a block can start left of (or below) the map and still reach into it, so the pooled grids
+		# need to be defined for those blocks as well
+		self.margin = 1 << (n_levels - 1)
+		padded = np.zeros((self.height + self.margin, self.width + self.margin), dtype=np.float32)
+		padded[self.margin:, self.margin:] = likelihood
+		self.pooled = self.build_pooled_grids(padded, n_levels)
+
+	@staticmethod
+	def build_pooled_grids(grid, n_levels):
+		""" Returns a list of grids where entry [y,x] of grid k is the max of the input over the
+			2^k x 2^k window whose lower left corner is (x,y).  Cells past the edge of the map count as 0. """
+		pooled = [grid.astype(np.float32)]
+		for k in range(1, n_levels):
+			step = 1 << (k-1)
+			prev = pooled[-1]
+			# the max over a window is separable, so pool along x and then along y
+			cur = prev.copy()
+			cur[:, :-step] = np.maximum(prev[:, :-step], prev[:, step:])
+			rows = cur.copy()
+			cur[:-step, :] = np.maximum(rows[:-step, :], rows[step:, :])
+			pooled.append(cur)
+		return pooled
+
+	def select_beams(self, angles, ranges):
+		""" Evenly subsample the scan down to at most n_beams beams """
+		angles = np.asarray(angles, dtype=np.float64)
+		ranges = np.asarray(ranges, dtype=np.float64)
+		if len(ranges) > self.n_beams:
+			keep = np.linspace(0, len(ranges) - 1, self.n_beams).astype(int)
+			angles = angles[keep]
+			ranges = ranges[keep]
+		return angles, ranges
+
+	def beam_offsets(self, angles, ranges, theta):
+		""" Cell offsets (relative to the cell the robot is in) of the scan endpoints when the robot has heading theta """
+		dx = np.floor(ranges*np.cos(theta + angles)/self.resolution).astype(np.int64)
+		dy = np.floor(ranges*np.sin(theta + angles)/self.resolution).astype(np.int64)
+		return dx, dy
+
+	def score_cells(self, level, cx, cy, dx, dy):
+		""" Score candidate cells (cx,cy) (arrays) on pooled grid level given the beam offsets (dx,dy).
+			Returns the mean pooled likelihood of the beam endpoints for every candidate. """
+		grid = self.pooled[level]
+		rows, cols = grid.shape
+		px = cx[:, np.newaxis] + dx[np.newaxis, :] + self.margin
+		py = cy[:, np.newaxis] + dy[np.newaxis, :] + self.margin
+		inside = (px >= 0) & (px < cols) & (py >= 0) & (py < rows)
+		values = np.where(inside, grid[np.clip(py, 0, rows - 1), np.clip(px, 0, cols - 1)], 0.0)
+		return values.mean(axis=1)
+
+	def match(self, angles, ranges, k=10, center=None, linear_window=None, angular_window=None,
+			  min_separation=0.5, angular_separation=math.pi/8, max_expansions=20000, max_seconds=None):
+		""" Return up to k of the best scoring poses for the scan as a list of (x, y, theta, score) tuples,
+			best first.
+			angles, ranges: the bearing (relative to the robot) and range of every valid beam
+			k: the number of candidates to return
+			center: an (x,y,theta) triple to search around.  If this is ommitted the whole map is searched
+			linear_window: half width (in meters) of the square of positions searched around center
+			angular_window: half width (in radians) of the headings searched around center
+			min_separation, angular_separation: returned candidates closer than this to a better candidate
+												in both position and heading are skipped
+			max_expansions: limit on the number of search nodes expanded
+			max_seconds: if given, the search stops after this long and returns the candidates found so far """
+		angles, ranges = self.select_beams(angles, ranges)
+		if len(ranges) == 0:
+			return []
+
+		# work out which cells and headings to search
+		if center is None or linear_window is None:
+			x_lo, x_hi, y_lo, y_hi = 0, self.width, 0, self.height
+		else:
+			cx = int((center[0] - self.origin_x)/self.resolution)
+			cy = int((center[1] - self.origin_y)/self.resolution)
+			half = int(math.ceil(linear_window/self.resolution))
+			x_lo, x_hi = max(cx - half, 0), min(cx + half + 1, self.width)
+			y_lo, y_hi = max(cy - half, 0), min(cy + half + 1, self.height)
+			if x_lo >= x_hi or y_lo >= y_hi:
+				return []
+		if center is None or angular_window is None:
+			thetas = np.arange(0.0, 2*math.pi, self.angular_step)
+		else:
+			n_side = int(math.ceil(angular_window/self.angular_step))
+			thetas = center[2] + self.angular_step*np.arange(-n_side, n_side + 1)
+
+		deadline = None if max_seconds == None else time.time() + max_seconds
+
+		# score every block of the coarsest grid.  A whole map has millions of them (blocks times headings), so
+		# they stay in arrays and are taken best first alongside the heap of finer blocks instead of all going
+		# into the heap as tuples
+		top = self.n_levels - 1
+		span = 1 << top
+		grid_x, grid_y = np.meshgrid(np.arange(x_lo, x_hi, span), np.arange(y_lo, y_hi, span))
+		grid_x = grid_x.ravel()
+		grid_y = grid_y.ravel()
+		offsets = []
+		top_scores = np.empty((len(thetas), len(grid_x)), dtype=np.float32)
+		for t in range(len(thetas)):
+			dx, dy = self.beam_offsets(angles, ranges, thetas[t])
+			offsets.append((dx, dy))
+			top_scores[t] = self.score_cells(top, grid_x, grid_y, dx, dy)
+		top_scores = top_scores.ravel()
+		top_blocks = self.descending(top_scores)
+		next_top = next(top_blocks, None)
+		heap = []
+
+		# best first search: because pooled scores never underestimate, leaves pop in order of their true score
+		results = []
+		expansions = 0
+		while (heap or next_top != None) and len(results) < k and expansions < max_expansions:
+			if deadline != None and time.time() > deadline:
+				break
+			if next_top != None and (not heap or top_scores[next_top] >= -heap[0][0]):
+				t, i = divmod(next_top, len(grid_x))
+				neg_score, level, x, y = -top_scores[next_top], top, int(grid_x[i]), int(grid_y[i])
+				next_top = next(top_blocks, None)
+			else:
+				neg_score, level, x, y, t = heapq.heappop(heap)
+			if self.covered_by(results, level, x, y, thetas[t], min_separation, angular_separation):
+				continue
+			if level == 0:
+				if self.free_grid[y, x]:
+					results.append((x*self.resolution + self.origin_x, y*self.resolution + self.origin_y, thetas[t], -neg_score))
+				continue
+			expansions += 1
+			# split the block into its four children on the next finer grid
+			half = 1 << (level - 1)
+			child_x = np.array([x, x + half, x, x + half])
+			child_y = np.array([y, y, y + half, y + half])
+			valid = (child_x < x_hi) & (child_y < y_hi)
+			child_x = child_x[valid]
+			child_y = child_y[valid]
+			dx, dy = offsets[t]
+			scores = self.score_cells(level - 1, child_x, child_y, dx, dy)
+			for i in range(len(scores)):
+				heapq.heappush(heap, (-scores[i], level - 1, int(child_x[i]), int(child_y[i]), t))
+		return results
+
+	@staticmethod
+	def descending(scores, chunk=4096):
+		""" Yields the indices of scores from the highest score down.  Only chunk of them are sorted at a time, since
+			the search usually stops long before it gets through all of them """
+		scores = np.array(scores)
+		while True:
+			if len(scores) > chunk:
+				best = np.argpartition(-scores, chunk - 1)[:chunk]
+			else:
+				best = np.arange(len(scores))
+			best = best[np.argsort(-scores[best], kind='mergesort')]
+			# the ones that were already yielded are marked with -inf
+			best = best[scores[best] > -np.inf]
+			if len(best) == 0:
+				return
+			for index in best:
+				yield int(index)
+			scores[best] = -np.inf
+
+	def covered_by(self, results, level, x, y, theta, min_separation, angular_separation):
+		""" Returns True if every pose in the block at (x,y) on the given level is within the separation
+			limits of a candidate that has already been accepted """
+		if not results:
+			return False
+		size = (1 << level)*self.resolution
+		block_x = x*self.resolution + self.origin_x + size/2.0
+		block_y = y*self.resolution + self.origin_y + size/2.0
+		reach = min_separation - size/math.sqrt(2.0)
+		if reach < 0:
+			return False
+		for result in results:
+			heading = se2.diff(theta, result[2])
+			if math.fabs(heading) < angular_separation and math.hypot(block_x - result[0], block_y - result[1]) < reach:
+				return True
+		return False
+
+class CandidateSearch:
+	""" Keeps the best scan matcher candidates for recent scans at hand without making the caller wait for a search
+		over the whole map.  Searches run in a background thread (one at a time), and the candidates of the latest
+		finished search are moved along with the odometry since the scan they were found for
+		Attributes:
+			scan_matcher: the CorrelativeScanMatcher that does the searching
+			k: the number of candidates each search looks for
+			background: if True searches run in a background thread, otherwise request blocks until the search is done
+			max_seconds: time limit of each search (None for no limit)
+			found: the candidates of the latest finished search (as returned by CorrelativeScanMatcher.match), the
+				   odometry pose of the robot at the scan they were found for and the number of the search, None until
+				   a search finishes
+			searches: the number of searches started so far (searches are numbered from 1)
+	"""
+
+	def __init__(self, scan_matcher, k=10, background=True, max_seconds=None):
+		self.scan_matcher = scan_matcher
+		self.k = k
+		self.background = background
+		self.max_seconds = max_seconds
+		self.found = None
+		self.searches = 0
+		self._thread = None
+
+	def busy(self):
+		""" True while a background search is running """
+		return self._thread != None and self._thread.is_alive()
+
+	def request(self, angles, ranges, odom_xy_theta):
+		""" Search the whole map for the scan with valid beams angles, ranges, taken at odom_xy_theta in the odometry
+			frame.  Ignored while a search is still running.  Returns the number of the search that answers the request
+			(the one that is still running, if any) """
+		if self.busy():
+			return self.searches
+		self.searches += 1
+		if not self.background:
+			self._search(angles, ranges, odom_xy_theta, self.searches)
+			return self.searches
+		self._thread = threading.Thread(target=self._search, args=(angles, ranges, odom_xy_theta, self.searches))
+		self._thread.daemon = True
+		self._thread.start()
+		return self.searches
+
+	def _search(self, angles, ranges, odom_xy_theta, number):
+		candidates = self.scan_matcher.match(angles, ranges, k=self.k, max_seconds=self.max_seconds)
+		# a single assignment, so a reader never pairs the candidates with the wrong odometry
+		self.found = (candidates, odom_xy_theta, number)
+
+	def answered(self, number):
+		""" True once search number (or a later one) has finished """
+		return self.found != None and self.found[2] >= number
+
+	def latest(self, odom_xy_theta):
+		""" The latest candidates moved by the change in odometry from their scan to odom_xy_theta, or None if no
+			search has found any yet """
+		if self.found == None or not self.found[0]:
+			return None
+		candidates, found_at, number = self.found
+		motion = se2.compose(se2.invert(found_at), odom_xy_theta)
+		moved = se2.compose(np.array([c[:3] for c in candidates]), motion)
+		return [(float(pose[0]), float(pose[1]), float(se2.wrap_positive(pose[2])), c[3])
+				for pose, c in zip(moved, candidates)]
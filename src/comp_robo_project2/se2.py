@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+""" Angle and SE(2) pose utilities that work on whole arrays of particles at once.
+
+	Poses are (x,y,theta) arrays of shape (3,) or (n,3), angles are in radians and every function also accepts
+	plain floats.  The filter keeps particle headings in [0,2*pi) (wrap_positive), differences between headings are
+	in [-pi,pi] (normalize, diff), and headings are averaged on the circle (circular_mean) rather than linearly.
+
+	Run this module (python -m comp_robo_project2.se2) to check the array functions against the scalar versions they
+	replace.  It exits with status 1 when any of them differs by more than SCALAR_TOLERANCE.
+"""
+
+import math
+import sys
+
+import numpy as np
+
+TWO_PI = 2*math.pi
+
+# the largest difference from the scalar math check_against_scalar accepts (the functions only reorder floating
+# point operations, so anything past rounding error is a bug)
+SCALAR_TOLERANCE = 1e-12
+
+def normalize(angles):
+	""" Map angles to the range [-pi,pi] """
+	angles = np.asarray(angles, dtype=np.float64)
+	return np.arctan2(np.sin(angles), np.cos(angles))
+
+def wrap_positive(angles, out=None):
+	""" Map angles to the range [0,2*pi), in place when out is given """
+	return np.mod(angles, TWO_PI, out=out)
+
+def diff(a, b):
+	""" The shortest rotation from angle b to angle a (a - b mapped to [-pi,pi]) """
+	return normalize(np.subtract(a, b))
+
+def compose(a, b):
+	""" The pose b expressed in the frame a is expressed in, i.e. a*b.  a and b broadcast against each other """
+	a = np.asarray(a, dtype=np.float64)
+	b = np.asarray(b, dtype=np.float64)
+	cos_a = np.cos(a[...,2])
+	sin_a = np.sin(a[...,2])
+	return np.stack((a[...,0] + cos_a*b[...,0] - sin_a*b[...,1],
+					 a[...,1] + sin_a*b[...,0] + cos_a*b[...,1],
+					 normalize(a[...,2] + b[...,2])), axis=-1)
+
+def invert(a):
+	""" The inverse of the pose(s) a, so that compose(a, invert(a)) is the identity """
+	a = np.asarray(a, dtype=np.float64)
+	cos_a = np.cos(a[...,2])
+	sin_a = np.sin(a[...,2])
+	return np.stack((-cos_a*a[...,0] - sin_a*a[...,1],
+					 sin_a*a[...,0] - cos_a*a[...,1],
+					 -a[...,2]), axis=-1)
+
+def mean_resultant(angles, weights=None):
+	""" The (weighted) average of the unit vectors pointing along angles, as (cos, sin) components """
+	angles = np.asarray(angles, dtype=np.float64)
+	if weights is None:
+		return np.mean(np.cos(angles)), np.mean(np.sin(angles))
+	weights = np.asarray(weights, dtype=np.float64)
+	total = np.sum(weights)
+	return np.dot(weights, np.cos(angles))/total, np.dot(weights, np.sin(angles))/total
+
+def circular_mean(angles, weights=None):
+	""" The (weighted) mean direction of angles, in [-pi,pi] """
+	c, s = mean_resultant(angles, weights)
+	return math.atan2(s, c)
+
+def circular_variance(angles, weights=None):
+	""" The (weighted) circular variance of angles: 0 when they all agree, 1 when they cancel out """
+	c, s = mean_resultant(angles, weights)
+	return 1.0 - math.hypot(c, s)
+
+def mean_pose(x, y, theta, weights=None):
+	""" The (weighted) mean of a set of poses, averaging the headings on the circle.  Returns (x, y, theta) with
+		theta in [-pi,pi] """
+	if weights is None:
+		return float(np.mean(x)), float(np.mean(y)), circular_mean(theta)
+	weights = np.asarray(weights, dtype=np.float64)
+	total = np.sum(weights)
+	return float(np.dot(weights, x)/total), float(np.dot(weights, y)/total), circular_mean(theta, weights)
+
+def check_against_scalar(n=10000, seed=0):
+	""" Compare the array functions to the scalar math they replaced on random inputs.  Returns the largest
+		difference for each function (as a dict) """
+	rng = np.random.RandomState(seed)
+	a = rng.uniform(-20, 20, n)
+	b = rng.uniform(-20, 20, n)
+	errors = {}
+
+	errors['normalize'] = np.max(np.abs(normalize(a) - [math.atan2(math.sin(z), math.cos(z)) for z in a]))
+
+	def scalar_angle_diff(a, b):
+		a = math.atan2(math.sin(a), math.cos(a))
+		b = math.atan2(math.sin(b), math.cos(b))
+		d1 = a - b
+		d2 = 2*math.pi - math.fabs(d1)
+		if d1 > 0:
+			d2 *= -1.0
+		return d1 if math.fabs(d1) < math.fabs(d2) else d2
+	errors['diff'] = np.max(np.abs(diff(a, b) - [scalar_angle_diff(p, q) for p, q in zip(a, b)]))
+
+	errors['wrap_positive'] = np.max(np.abs(wrap_positive(a) - [(z + 2*math.pi) % (2*math.pi) for z in a]))
+
+	poses = np.column_stack((rng.uniform(-5, 5, n), rng.uniform(-5, 5, n), rng.uniform(-math.pi, math.pi, n)))
+	others = np.column_stack((rng.uniform(-5, 5, n), rng.uniform(-5, 5, n), rng.uniform(-math.pi, math.pi, n)))
+	identity = compose(poses, invert(poses))
+	errors['compose/invert'] = np.max(np.abs(identity))
+	composed = compose(poses, others)
+	scalar = [(p[0] + math.cos(p[2])*q[0] - math.sin(p[2])*q[1], p[1] + math.sin(p[2])*q[0] + math.cos(p[2])*q[1],
+			   math.atan2(math.sin(p[2] + q[2]), math.cos(p[2] + q[2]))) for p, q in zip(poses, others)]
+	errors['compose'] = np.max(np.abs(composed - scalar))
+
+	# the component averaging the filter used to find the mean heading of its best particles
+	def scalar_resultant(theta, weights):
+		total = sum(weights)
+		return (sum(w*math.cos(t) for t, w in zip(theta, weights))/total,
+				sum(w*math.sin(t) for t, w in zip(theta, weights))/total)
+	theta = rng.normal(1.0, 0.5, 100)
+	weights = rng.random_sample(100)
+	ones = [1.0]*len(theta)
+	c, s = scalar_resultant(theta, ones)
+	errors['circular_mean'] = math.fabs(circular_mean(theta) - math.atan2(s, c))
+	errors['circular_variance'] = math.fabs(circular_variance(theta) - (1.0 - math.hypot(c, s)))
+	c, s = scalar_resultant(theta, weights)
+	errors['weighted circular_mean'] = math.fabs(circular_mean(theta, weights) - math.atan2(s, c))
+	errors['weighted circular_variance'] = math.fabs(circular_variance(theta, weights) - (1.0 - math.hypot(c, s)))
+
+	x = rng.uniform(-5, 5, 100)
+	y = rng.uniform(-5, 5, 100)
+	scalar = (sum(w*p for p, w in zip(x, weights))/sum(weights), sum(w*p for p, w in zip(y, weights))/sum(weights),
+			  math.atan2(s, c))
+	errors['mean_pose'] = max(math.fabs(p - q) for p, q in zip(mean_pose(x, y, theta, weights), scalar))
+	c, s = scalar_resultant(theta, ones)
+	scalar = (sum(x)/len(x), sum(y)/len(y), math.atan2(s, c))
+	errors['unweighted mean_pose'] = max(math.fabs(p - q) for p, q in zip(mean_pose(x, y, theta), scalar))
+	return errors
+
+if __name__ == '__main__':
+	failed = []
+	for name, error in sorted(check_against_scalar().items()):
+		ok = error <= SCALAR_TOLERANCE
+		print "%-28s max difference %g %s" % (name, error, 'ok' if ok else 'FAILED')
+		if not ok:
+			failed.append(name)
+	if failed:
+		print "differ from the scalar math by more than %g: %s" % (SCALAR_TOLERANCE, ', '.join(failed))
+		sys.exit(1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+""" Helpers that keep the particle filter node's startup short: a map fetch that runs in the background,
+	an on-disk cache of occupancy field distance grids, and a profile of where startup time went. """
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+class StartupProfile:
+	""" Records how long each startup phase took
+		Attributes:
+			start: the time (in seconds since the epoch) startup began
+			phases: list of (name, seconds) tuples in the order they were recorded
+			finished: True once the first filter update has been recorded
+	"""
+
+	def __init__(self, start=None):
+		self.start = time.time() if start == None else start
+		self.phases = []
+		self.finished = False
+		self._phase_start = None
+
+	def add(self, name, seconds):
+		""" Record a phase that was timed elsewhere """
+		self.phases.append((name, seconds))
+
+	def begin(self):
+		""" Start timing the next phase """
+		self._phase_start = time.time()
+
+	def end(self, name):
+		""" Record the time since the last call to begin as phase name """
+		self.add(name, time.time() - self._phase_start)
+
+	def finish(self, first_update_seconds):
+		""" Record the duration of the first filter update and mark startup as done """
+		self.add('first update', first_update_seconds)
+		self.finished = True
+
+	def report(self):
+		""" A multi-line summary of the recorded phases """
+		lines = ['startup profile:']
+		for name, seconds in self.phases:
+			lines.append('  %-16s %8.3f s' % (name, seconds))
+		lines.append('  %-16s %8.3f s' % ('total', time.time() - self.start))
+		return '\n'.join(lines)
+
+class MapFetcher(threading.Thread):
+	""" Requests the map from a map_server's static_map service in the background so that the rest of
+		the node can be set up while waiting for it
+		Attributes:
+			service: the name of the service to call
+			map: the nav_msgs/OccupancyGrid that was received (None until the fetch is done)
+			error: the exception raised while fetching, if any
+			elapsed: how long the fetch took in seconds
+	"""
+
+	def __init__(self, service='static_map'):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.service = service
+		self.map = None
+		self.error = None
+		self.elapsed = None
+
+	def run(self):
+		import rospy
+		from nav_msgs.srv import GetMap
+		start = time.time()
+		try:
+			rospy.wait_for_service(self.service)
+			self.map = rospy.ServiceProxy(self.service, GetMap)().map
+		except Exception as e:
+			self.error = e
+		self.elapsed = time.time() - start
+
+	def wait(self):
+		""" Block until the map arrives and return it """
+		while self.is_alive():
+			# join with a timeout so that the main thread still responds to ctrl-c
+			self.join(0.1)
+		if self.error != None:
+			raise self.error
+		return self.map
+
+class OccupancyFieldCache:
+	""" Stores the distance grids of occupancy fields on disk, keyed by a hash of the map, so that they only
+		have to be computed the first time a map is used.  The most recently used entry can be loaded before
+		the map has arrived (see prefetch)
+		Attributes:
+			directory: where cache entries are stored
+			mmap_mode: passed to numpy.load, 'r' memory maps entries so that processes using the same map share one copy
+	"""
+
+	def __init__(self, directory=None, mmap_mode=None):
+		if directory == None:
+			directory = os.path.join(os.environ.get('ROS_HOME', os.path.join(os.path.expanduser('~'), '.ros')), 'comp_robo_project2')
+		self.directory = directory
+		self.mmap_mode = mmap_mode
+		self._prefetched = (None, None)
+
+	@staticmethod
+	def key(info, grid):
+		""" A hash identifying a map, given its metadata and its occupancy values as a numpy array """
+		digest = hashlib.sha1()
+		digest.update(('%d %d %r %r %r' % (info.width, info.height, info.resolution,
+										   info.origin.position.x, info.origin.position.y)).encode('ascii'))
+		digest.update(np.ascontiguousarray(grid).tobytes())
+		return digest.hexdigest()
+
+	def path(self, key):
+		return os.path.join(self.directory, 'occupancy_field_' + key + '.npy')
+
+	def prefetch(self):
+		""" Load the most recently used entry so that it is ready if the incoming map turns out to be the same """
+		try:
+			with open(os.path.join(self.directory, 'latest'), 'r') as f:
+				key = f.read().strip()
+			self._prefetched = (key, np.load(self.path(key), mmap_mode=self.mmap_mode))
+		except (IOError, OSError, ValueError):
+			self._prefetched = (None, None)
+
+	def load(self, key):
+		""" Return the cached distance grid for key, or None if there isn't one """
+		if self._prefetched[0] == key:
+			return self._prefetched[1]
+		try:
+			distance_grid = np.load(self.path(key), mmap_mode=self.mmap_mode)
+		except (IOError, OSError, ValueError):
+			return None
+		self.mark_latest(key)
+		return distance_grid
+
+	def store(self, key, distance_grid):
+		""" Save distance_grid for key and mark it as the most recently used entry.  Failures are not fatal """
+		try:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory)
+			np.save(self.path(key), distance_grid)
+		except (IOError, OSError):
+			return
+		self.mark_latest(key)
+
+	def mark_latest(self, key):
+		""" Remember key as the entry to prefetch next time """
+		try:
+			with open(os.path.join(self.directory, 'latest'), 'w') as f:
+				f.write(key)
+		except (IOError, OSError):
+			pass
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+""" Synthetic floors and drives for the benchmarks: maps of rooms with doorways and boxes, and the scans and
+	odometry of a simulated robot driving around them, so that the filter can be run without recordings or ROS.
+	Also holds the bits of scoring and reporting the benchmarks share.
+"""
+
+import math
+
+import numpy as np
+
+from comp_robo_project2.map_loader import LoadedMap, MapInfo, MapOrigin
+
+RESOLUTION = 0.05
+ROOM_SIZE = 160					# cells between walls (8 m rooms)
+DOOR_SIZE = 24					# cells
+CONVERGED_DISTANCE = 0.3		# meters
+
+def synthetic_map(size, density, seed=0):
+	""" A size x size LoadedMap of square rooms with doorways between them, with density of the floor covered by
+		random boxes.  The map is centered on the origin, like the maps in maps/ """
+	rng = np.random.RandomState(seed)
+	grid = np.zeros((size, size), dtype=np.int8)
+	grid[:2,:] = grid[-2:,:] = grid[:,:2] = grid[:,-2:] = 100
+	for wall in range(ROOM_SIZE, size - ROOM_SIZE//2, ROOM_SIZE):
+		grid[wall:wall + 2,:] = 100
+		grid[:,wall:wall + 2] = 100
+		# a doorway in every wall segment between two rooms
+		for start in range(0, size - DOOR_SIZE, ROOM_SIZE):
+			door = start + rng.randint(8, ROOM_SIZE - DOOR_SIZE - 8)
+			grid[wall:wall + 2, door:door + DOOR_SIZE] = 0
+			grid[door:door + DOOR_SIZE, wall:wall + 2] = 0
+	# boxes of 4 to 20 cells on a side until density of the map is covered
+	n_boxes = int(density*size*size/144.0)
+	corners = rng.randint(0, size, (n_boxes, 2))
+	sides = rng.randint(4, 21, (n_boxes, 2))
+	for (x, y), (w, h) in zip(corners, sides):
+		grid[y:y + h, x:x + w] = 100
+	origin = -size*RESOLUTION/2.0
+	return LoadedMap(MapInfo(RESOLUTION, size, size, MapOrigin(origin, origin)), grid.ravel())
+
+def drive(field, kernels, n_scans, seed=0, odom_noise=0.0):
+	""" Simulate a robot driving around the map of field.  Returns the (n x 360) scans, the odometry and the true
+		poses (both n x 3).
+		odom_noise: standard deviation of the odometry error as a fraction of each step: every translation and
+					rotation is scaled by (1 + noise), and translating also drifts the odometry heading by noise
+					radians per meter.  0 gives perfect odometry """
+	from scipy.ndimage import distance_transform_edt
+	rng = np.random.RandomState(seed)
+	# only drive through known free cells well away from obstacles (real maps have unknown space around them)
+	clearance = distance_transform_edt(~field.occupied_grid)
+	drivable = field.free_grid & (clearance > 6)
+	start = np.argwhere(field.free_grid & (clearance > 12))
+	y, x = start[rng.randint(len(start))]
+	origin = (field.origin.position.x, field.origin.position.y)
+	truth = [origin[0] + (x + 0.5)*field.resolution, origin[1] + (y + 0.5)*field.resolution, rng.uniform(0, 2*math.pi)]
+	# the odometry error has its own random stream so the true path doesn't depend on odom_noise
+	noise = np.random.RandomState(seed + 1)
+	odom = [0.0, 0.0, 0.0]
+	angles = np.arange(360)/360.0*2*math.pi
+	scans = np.empty((n_scans, 360))
+	odoms = np.empty((n_scans, 3))
+	truths = np.empty((n_scans, 3))
+	for i in range(n_scans):
+		nx = truth[0] + 0.05*math.cos(truth[2])
+		ny = truth[1] + 0.05*math.sin(truth[2])
+		row = int(math.floor((ny - origin[1])/field.resolution))
+		column = int(math.floor((nx - origin[0])/field.resolution))
+		if 0 <= row < drivable.shape[0] and 0 <= column < drivable.shape[1] and drivable[row, column]:
+			truth[0], truth[1] = nx, ny
+			step = 0.05*(1 + noise.normal(0, odom_noise)) if odom_noise > 0 else 0.05
+			odom[0] += step*math.cos(odom[2])
+			odom[1] += step*math.sin(odom[2])
+			if odom_noise > 0:
+				odom[2] += noise.normal(0, odom_noise*0.05)
+		else:
+			truth[2] += 0.3
+			odom[2] += 0.3*(1 + noise.normal(0, odom_noise)) if odom_noise > 0 else 0.3
+		beams = kernels.calc_range(np.full(360, truth[0]), np.full(360, truth[1]), truth[2] + angles,
+								   field.occupied_grid, origin, field.resolution, 6.0)
+		# beams that don't hit anything come back as 0, like the neato's
+		scans[i] = np.where(beams < 6.0, beams, 0.0)
+		odoms[i] = odom
+		truths[i] = truth
+	return scans, odoms, truths
+
+def convergence_scans(errors, distance=CONVERGED_DISTANCE):
+	""" The number of scans until the position error (one per scan) stays under distance for the rest of the drive,
+		or None if it never settles """
+	diverged = np.flatnonzero(np.asarray(errors) >= distance)
+	converged = diverged[-1] + 1 if len(diverged) else 0
+	if converged < len(errors):
+		return converged + 1
+	return None
+
+def format_value(value, fmt):
+	""" value formatted with fmt for a report table, '-' when it is missing """
+	if value in (None, ''):
+		return '-'
+	return fmt % value
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+""" Records what the particle filter does on every update (particle arrays, weights, effective sample size, the
+	chosen pose and how long each stage took) so that runs can be analyzed afterwards instead of being printed.
+
+	A recording is a directory of compressed chunks.  Each chunk (chunk_<first>_<count>.npz) holds count consecutive
+	records column by column: a column of scalars is one array with an entry per record, and a column of arrays
+	(like the particle x coordinates) is stored flat with a <name>__offsets array marking where each record starts.
+	Chunks are written on a background thread, so all record() costs the filter is a copy of the arrays.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+import numpy as np
+
+CHUNK_NAME = re.compile(r'chunk_(\d+)_(\d+)\.npz$')
+OFFSETS = '__offsets'
+
+class StageTimer:
+	""" Times consecutive stages of an update.  Call lap with each stage's name as it finishes
+		Attributes:
+			times: dictionary of stage name to seconds
+	"""
+
+	def __init__(self):
+		self.times = {}
+		self._last = time.time()
+
+	def lap(self, name):
+		now = time.time()
+		self.times[name] = now - self._last
+		self._last = now
+
+class TelemetryRecorder:
+	""" Streams records to a telemetry directory on a background writer thread
+		Attributes:
+			path: the directory the chunks are written to
+			chunk_size: the number of records per chunk
+			max_queued: the number of records that can wait for the writer before record() starts dropping them
+			recorded: the number of records handed to the writer
+			dropped: the number of records dropped because the writer fell behind
+	"""
+
+	def __init__(self, path, chunk_size=64, max_queued=256):
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self.path = path
+		self.chunk_size = chunk_size
+		self.max_queued = max_queued
+		self.recorded = 0
+		self.dropped = 0
+		self._queue = queue.Queue(max_queued)
+		self._writer = threading.Thread(target=self._write_chunks)
+		self._writer.daemon = True
+		self._writer.start()
+
+	def record(self, **columns):
+		""" Queue one record.  Values are scalars or 1d arrays, arrays are copied so the caller can keep changing them.
+			Never blocks: if the writer is max_queued records behind the record is dropped (and counted) """
+		for name, value in columns.items():
+			if isinstance(value, np.ndarray):
+				columns[name] = value.copy()
+		try:
+			self._queue.put_nowait(columns)
+		except queue.Full:
+			self.dropped += 1
+			return
+		self.recorded += 1
+
+	def close(self):
+		""" Write out whatever is still queued and stop the writer """
+		if self._writer.is_alive():
+			self._queue.put(None)
+			self._writer.join()
+
+	def _write_chunks(self):
+		records = []
+		first = 0
+		while True:
+			record = self._queue.get()
+			if record != None:
+				records.append(record)
+			if records and (record == None or len(records) == self.chunk_size):
+				self._write_chunk(first, records)
+				first += len(records)
+				records = []
+			if record == None:
+				return
+
+	def _write_chunk(self, first, records):
+		names = set()
+		for record in records:
+			names.update(record.keys())
+		arrays = {}
+		for name in names:
+			values = [record.get(name) for record in records]
+			if any(isinstance(value, np.ndarray) for value in values):
+				parts = [np.ravel(value) if value is not None else np.empty(0) for value in values]
+				arrays[name] = np.concatenate(parts)
+				arrays[name + OFFSETS] = np.cumsum([0] + [len(part) for part in parts])
+			else:
+				arrays[name] = np.array([value if value is not None else np.nan for value in values])
+		filename = os.path.join(self.path, 'chunk_%08d_%d.npz' % (first, len(records)))
+		# write under a temporary name so that a reader never sees half a chunk
+		with open(filename + '.tmp', 'wb') as f:
+			np.savez_compressed(f, **arrays)
+		os.rename(filename + '.tmp', filename)
+
+class TelemetryReader:
+	""" Reads a telemetry directory.  Chunks are only loaded when a slice needs them, one column at a time
+		Attributes:
+			path: the telemetry directory
+			chunks: list of (first record, number of records, filename) for every chunk, in order
+			max_open: the number of chunk files kept open (the least recently used one is closed past that)
+	"""
+
+	def __init__(self, path, max_open=4):
+		self.path = path
+		self.max_open = max_open
+		self.chunks = []
+		for filename in os.listdir(path):
+			match = CHUNK_NAME.match(filename)
+			if match:
+				self.chunks.append((int(match.group(1)), int(match.group(2)), os.path.join(path, filename)))
+		self.chunks.sort()
+		self._open = OrderedDict()
+
+	def __len__(self):
+		if not self.chunks:
+			return 0
+		return self.chunks[-1][0] + self.chunks[-1][1]
+
+	def _chunk(self, filename):
+		if filename in self._open:
+			# move it to the most recently used end
+			chunk = self._open.pop(filename)
+		else:
+			if len(self._open) >= self.max_open:
+				self._open.popitem(last=False)[1].close()
+			chunk = np.load(filename)
+		self._open[filename] = chunk
+		return chunk
+
+	def columns(self):
+		""" The names of the columns in the recording """
+		names = set()
+		for first, count, filename in self.chunks:
+			names.update(name for name in self._chunk(filename).files if not name.endswith(OFFSETS))
+		return sorted(names)
+
+	def column(self, name, start=0, stop=None):
+		""" The values of column name for records start to stop.  Scalar columns come back as an array with an entry
+			per record, array columns as a list with an array per record """
+		stop = len(self) if stop == None else min(stop, len(self))
+		parts = []
+		is_array = False
+		for first, count, filename in self.chunks:
+			if first + count <= start or first >= stop:
+				continue
+			lo = max(start - first, 0)
+			hi = min(stop - first, count)
+			chunk = self._chunk(filename)
+			if name + OFFSETS in chunk.files:
+				values = chunk[name]
+				offsets = chunk[name + OFFSETS]
+				parts.append([values[offsets[i]:offsets[i + 1]] for i in range(lo, hi)])
+				is_array = True
+			elif name in chunk.files:
+				parts.append(chunk[name][lo:hi])
+			else:
+				# the column wasn't recorded while this chunk was written
+				parts.append(hi - lo)
+		if is_array:
+			arrays = []
+			for part in parts:
+				arrays.extend([np.empty(0)]*part if isinstance(part, int) else part)
+			return arrays
+		return np.concatenate([np.full(part, np.nan) if isinstance(part, int) else part for part in parts] or [np.empty(0)])
+
+	def record(self, i):
+		""" Every column of record i as a dictionary """
+		return dict((name, self.column(name, i, i + 1)[0]) for name in self.columns())
+
+	def close(self):
+		for chunk in self._open.values():
+			chunk.close()
+		self._open = OrderedDict()
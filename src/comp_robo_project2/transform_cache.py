@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+""" Keeps tf out of the particle filter's per-scan latency budget.
+
+	Static extrinsics (such as where the laser sits on the robot base) are looked up once and remembered, the
+	odometry pose is read with a single timestamped lookup per scan, and the map/odom algebra is done on
+	(x,y,theta) SE(2) arrays instead of by round-tripping PoseStamped messages through the listener.
+"""
+
+import math
+
+import numpy as np
+
+from comp_robo_project2.se2 import compose, invert
+
+def yaw_from_quaternion(q):
+	""" The yaw of an (x,y,z,w) quaternion """
+	return math.atan2(2.0*(q[3]*q[2] + q[0]*q[1]), 1.0 - 2.0*(q[1]*q[1] + q[2]*q[2]))
+
+def quaternion_from_yaw(yaw):
+	""" An (x,y,z,w) quaternion for a rotation of yaw about the z axis """
+	return (0.0, 0.0, math.sin(yaw/2.0), math.cos(yaw/2.0))
+
+def to_translation_rotation(pose):
+	""" Convert an SE(2) pose to the (translation, rotation) tuples tf.TransformBroadcaster.sendTransform expects """
+	return ((float(pose[0]), float(pose[1]), 0.0), quaternion_from_yaw(pose[2]))
+
+class TransformCache:
+	""" Answers the transform queries the particle filter makes on every scan with as few tf calls as possible
+		Attributes:
+			listener: the tf.TransformListener to query
+			base_frame: the frame of the robot base
+			odom_frame: the frame of the odometry
+			static: the SE(2) pose in the base frame of every static frame looked up so far (keyed by frame id)
+	"""
+
+	def __init__(self, listener, base_frame, odom_frame):
+		import tf
+		self.listener = listener
+		self.base_frame = base_frame
+		self.odom_frame = odom_frame
+		self.static = {}
+		self._tf_errors = (tf.Exception, tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException)
+
+	def lookup(self, target_frame, source_frame, stamp):
+		""" The SE(2) pose of source_frame in target_frame at stamp, or None if tf can't provide it (yet) """
+		try:
+			(translation, rotation) = self.listener.lookupTransform(target_frame, source_frame, stamp)
+		except self._tf_errors:
+			return None
+		return np.array([translation[0], translation[1], yaw_from_quaternion(rotation)])
+
+	def static_pose(self, frame_id):
+		""" The SE(2) pose of the rigidly mounted frame frame_id in the base frame.  Only the first successful
+			lookup goes through tf, every later call is a dictionary lookup """
+		pose = self.static.get(frame_id)
+		if pose is None:
+			import rospy
+			pose = self.lookup(self.base_frame, frame_id, rospy.Time(0))
+			if pose is not None:
+				self.static[frame_id] = pose
+		return pose
+
+	def odom_pose(self, stamp):
+		""" The SE(2) pose of the robot base in the odometry frame at stamp, or None if it isn't available """
+		return self.lookup(self.odom_frame, self.base_frame, stamp)
+
+	@staticmethod
+	def map_to_odom(robot_pose, odom_pose):
+		""" The SE(2) pose of the odometry frame in the map frame, given the robot's pose in the map (robot_pose) and
+			in the odometry frame (odom_pose) at the same instant """
+		return compose(robot_pose, invert(odom_pose))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+""" Decides how much of the particle filter pipeline to run for each incoming scan. """
+
+import math
+
+import numpy as np
+
+from comp_robo_project2 import se2
+
+class UpdateScheduler:
+	""" Chooses between skipping a scan, a lightweight weight-only update and a full filter cycle based on how far
+		the robot has moved (with headings compared modulo 2*pi) and on the effective sample size (ESS) of the cloud.
+		Attributes:
+			d_thresh: the amount of linear movement before triggering a full update
+			a_thresh: the amount of angular movement before triggering a full update
+			light_fraction: the fraction of d_thresh / a_thresh that triggers a weight-only update
+			resample_threshold: resampling only happens when ESS / n_particles falls below this
+			last_full_xy_theta: the odometry pose at the last full update
+			metrics: counters describing the decisions made so far (see reset_metrics)
+	"""
+
+	SKIP = 'skip'
+	WEIGHT_ONLY = 'weight_only'
+	FULL = 'full'
+
+	def __init__(self, d_thresh, a_thresh, light_fraction=0.5, resample_threshold=0.1):
+		self.d_thresh = d_thresh
+		self.a_thresh = a_thresh
+		self.light_fraction = light_fraction
+		self.resample_threshold = resample_threshold
+		self.last_full_xy_theta = None
+		self.reset_metrics()
+
+	def reset_metrics(self):
+		""" Clear the decision counters """
+		self.metrics = {'scans': 0, UpdateScheduler.SKIP: 0, UpdateScheduler.WEIGHT_ONLY: 0, UpdateScheduler.FULL: 0,
+						'resampled': 0, 'resample_skipped': 0, 'ess': float('nan'), 'ess_ratio': float('nan'),
+						'gated_fraction': 0.0}
+
+	@staticmethod
+	def wrapped_delta(old_xy_theta, new_xy_theta):
+		""" Returns the change (dx, dy, dtheta) between two (x,y,theta) poses where dtheta is the shortest
+			rotation from the old heading to the new one (in the range [-pi,pi]) """
+		return (new_xy_theta[0] - old_xy_theta[0], new_xy_theta[1] - old_xy_theta[1], se2.diff(new_xy_theta[2], old_xy_theta[2]))
+
+	def decide(self, old_xy_theta, new_xy_theta):
+		""" Decide what to do with a scan given the odometry pose at the last update (of either kind) and the current one.
+			Full updates are triggered by the motion since the last full update, weight-only updates by the motion
+			since the last update of any kind.
+			Returns one of UpdateScheduler.SKIP, UpdateScheduler.WEIGHT_ONLY or UpdateScheduler.FULL """
+		if self.last_full_xy_theta == None:
+			self.last_full_xy_theta = old_xy_theta
+		if self.moved(self.last_full_xy_theta, new_xy_theta, 1.0):
+			decision = UpdateScheduler.FULL
+			self.last_full_xy_theta = new_xy_theta
+		elif self.moved(old_xy_theta, new_xy_theta, self.light_fraction):
+			decision = UpdateScheduler.WEIGHT_ONLY
+		else:
+			decision = UpdateScheduler.SKIP
+		self.metrics['scans'] += 1
+		self.metrics[decision] += 1
+		return decision
+
+	def moved(self, old_xy_theta, new_xy_theta, fraction):
+		""" Returns True if the robot moved more than fraction of d_thresh or a_thresh between the two poses """
+		delta = self.wrapped_delta(old_xy_theta, new_xy_theta)
+		return math.hypot(delta[0], delta[1]) > fraction*self.d_thresh or math.fabs(delta[2]) > fraction*self.a_thresh
+
+	@staticmethod
+	def effective_sample_size(weights, groups=None):
+		""" The effective number of particles 1/sum(w^2) of the (normalized) weights.  If groups is given (the index of
+			the distinct pose each particle is at) identical particles count as one particle with their summed weight,
+			so that a cloud of copies of a single pose has an ESS of 1 """
+		weights = np.asarray(weights, dtype=np.float64)
+		if groups is not None and len(weights):
+			weights = np.bincount(groups, weights)
+		total = np.sum(weights)
+		if not(total > 0):
+			return 0.0
+		weights = weights/total
+		return 1.0/np.sum(weights*weights)
+
+	def should_resample(self, weights, groups=None):
+		""" Returns True if the cloud has degenerated enough (low ESS) to be worth resampling.  groups is the index of
+			the distinct pose of each particle (see effective_sample_size), the ratio is still taken over all of them """
+		ess = self.effective_sample_size(weights, groups)
+		self.metrics['ess'] = ess
+		self.metrics['ess_ratio'] = ess/len(weights) if len(weights) else float('nan')
+		if self.metrics['ess_ratio'] < self.resample_threshold or math.isnan(self.metrics['ess_ratio']):
+			self.metrics['resampled'] += 1
+			return True
+		self.metrics['resample_skipped'] += 1
+		return False
+
+	def format_metrics(self):
+		""" A one line summary of the metrics that is suitable for logging or publishing """
+		return ' '.join('%s=%s' % (key, ('%.3f' % value) if isinstance(value, float) else value)
+						for key, value in sorted(self.metrics.items()))